@@ -0,0 +1,24 @@
+from sqlalchemy import text
+from backend.database import engine
+from backend.order_ids import ORDER_ID_BLOCK_SIZE
+
+def add_order_id_sequence():
+    # New orders get 8-character IDs from this sequence; existing 6-character
+    # IDs cannot collide with them and are left untouched, so customers'
+    # confirmation emails keep pointing at the right orders.
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE SEQUENCE IF NOT EXISTS order_id_seq START WITH 1 INCREMENT BY {ORDER_ID_BLOCK_SIZE}"
+        ))
+        increment = conn.execute(text(
+            "SELECT increment_by FROM pg_sequences WHERE sequencename = 'order_id_seq'"
+        )).scalar_one()
+    if increment != ORDER_ID_BLOCK_SIZE:
+        raise SystemExit(
+            f"order_id_seq increments by {increment} but ORDER_ID_BLOCK_SIZE is {ORDER_ID_BLOCK_SIZE}; "
+            "align them before deploying"
+        )
+    print("order_id_seq is in place.")
+
+if __name__ == "__main__":
+    add_order_id_sequence()
@@ -0,0 +1,19 @@
+from sqlalchemy import text
+from backend.database import engine
+from backend.models import Order
+
+def add_order_indexes():
+    # create_all only builds indexes for new tables, so existing databases
+    # get them here. CONCURRENTLY avoids locking the table against writes;
+    # it cannot run inside a transaction, hence AUTOCOMMIT.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for index in Order.__table__.indexes:
+            columns = ", ".join(column.name for column in index.columns)
+            print(f"Creating index {index.name} on order ({columns})...")
+            conn.execute(text(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON "order" ({columns})'
+            ))
+    print("Order indexes are in place.")
+
+if __name__ == "__main__":
+    add_order_indexes()
@@ -0,0 +1,292 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+import zipfile
+import zlib
+from typing import List, Optional, Tuple, Union
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, Header, HTTPException, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from .auth import get_optional_user
+from .batcher import MicroBatcher, Overloaded
+from .cache import DiskCache, ResultCache, TTLCache
+from .inference_pool import InferencePool
+from .metrics import Gauge
+from .model_config import CONFIDENCE_THRESHOLD, model_version
+from .models import User
+from .uploads import MULTIPART_OVERHEAD, ZIP_SIGNATURE, read_upload
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/ai", tags=["ai"])
+
+# Micro-batching: concurrent uploads are grouped into one forward pass.
+# A batch is dispatched when it is full or when the oldest request has
+# waited AI_MAX_BATCH_WAIT_MS, whichever comes first.
+AI_MAX_BATCH_SIZE = int(os.getenv("AI_MAX_BATCH_SIZE", 8))
+AI_MAX_BATCH_WAIT_MS = float(os.getenv("AI_MAX_BATCH_WAIT_MS", 10))
+
+# Admission control, per API process. At most AI_MAX_PENDING photos wait
+# for inference; past that, uploads get a 503 with Retry-After at once
+# instead of queueing for longer than anyone will wait. Staff uploads are
+# batched first and may displace a customer's queued photo. Every photo
+# has a deadline, the client's X-Request-Timeout-Ms (capped at
+# AI_MAX_DEADLINE_MS) or AI_DEFAULT_DEADLINE_MS, measured from when the
+# upload has arrived; one that can no longer be answered in time is
+# dropped before inference and gets a 503.
+AI_MAX_PENDING = int(os.getenv("AI_MAX_PENDING", 64))
+AI_DEFAULT_DEADLINE_MS = float(os.getenv("AI_DEFAULT_DEADLINE_MS", 15000))
+AI_MAX_DEADLINE_MS = float(os.getenv("AI_MAX_DEADLINE_MS", 60000))
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+PRIORITY_STAFF = 0
+PRIORITY_CUSTOMER = 1
+
+# Inference runs in worker processes (AI_WORKERS, AI_THREADS_PER_WORKER)
+# so the event loop keeps serving other endpoints during a burst.
+inference_pool = InferencePool()
+
+batcher = MicroBatcher(
+    inference_pool.run,
+    max_batch_size=AI_MAX_BATCH_SIZE,
+    max_wait_ms=AI_MAX_BATCH_WAIT_MS,
+    max_concurrent_batches=inference_pool.concurrency,
+    max_pending=AI_MAX_PENDING,
+    name="analyze",
+)
+
+# Result cache keyed by image hash + model version + threshold, so
+# re-uploads of the same photo skip decode and inference entirely.
+# Set AI_CACHE_DIR to add an on-disk tier shared by all workers, holding
+# at most AI_CACHE_DIR_MAX_ENTRIES files (0 for no cap).
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", 1024))
+AI_CACHE_TTL_SECONDS = float(os.getenv("AI_CACHE_TTL_SECONDS", 24 * 3600))
+AI_CACHE_DIR = os.getenv("AI_CACHE_DIR")
+AI_CACHE_DIR_MAX_ENTRIES = int(os.getenv("AI_CACHE_DIR_MAX_ENTRIES", 50000))
+
+result_cache = ResultCache(
+    TTLCache(AI_CACHE_SIZE, AI_CACHE_TTL_SECONDS, name="ai_results"),
+    DiskCache(AI_CACHE_DIR, AI_CACHE_TTL_SECONDS, AI_CACHE_DIR_MAX_ENTRIES, name="ai_results") if AI_CACHE_DIR else None,
+)
+MODEL_VERSION = model_version()
+
+# Largest single photo accepted by /ai/analyze
+AI_MAX_UPLOAD_BYTES = int(os.getenv("AI_MAX_UPLOAD_BYTES", 15 * 1024 * 1024))
+# Limits for /ai/analyze/batch, counted after zip archives are expanded
+AI_BATCH_MAX_IMAGES = int(os.getenv("AI_BATCH_MAX_IMAGES", 50))
+AI_BATCH_MAX_BYTES = int(os.getenv("AI_BATCH_MAX_BYTES", 50 * 1024 * 1024))
+
+# Whole-request body limits, enforced by UploadLimitMiddleware in main.py
+UPLOAD_LIMITS = {
+    "/ai/analyze": AI_MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,
+    "/ai/analyze/batch": AI_BATCH_MAX_BYTES + MULTIPART_OVERHEAD,
+}
+
+MODEL_LOAD_SECONDS = Gauge("ai_model_load_seconds", "Time to load the model (slowest worker)", multiprocess="max")
+FIRST_INFERENCE_SECONDS = Gauge("ai_first_inference_seconds", "Time of the warm-up inference (slowest worker)", multiprocess="max")
+MODEL_READY = Gauge("ai_model_ready", "1 once every inference worker has a warm model", multiprocess="min")
+
+# Flipped by the background warm-up; /readyz reports it to Kubernetes
+model_ready = False
+_warmup_task = None
+
+async def _warm_up_model():
+    global model_ready
+    try:
+        timings = await inference_pool.warm_up()
+    except Exception:
+        logger.exception("AI warm-up failed")
+        return
+    MODEL_LOAD_SECONDS.set(timings["model_load_seconds"])
+    FIRST_INFERENCE_SECONDS.set(timings["first_inference_seconds"])
+    MODEL_READY.set(1)
+    model_ready = True
+    logger.info(
+        "AI model ready: load %.2fs, first inference %.2fs",
+        timings["model_load_seconds"],
+        timings["first_inference_seconds"],
+    )
+
+async def start_inference():
+    global _warmup_task
+    inference_pool.start()
+    await batcher.start()
+    # Warm up in the background so the server starts (and passes liveness)
+    # immediately; readiness waits for the model.
+    _warmup_task = asyncio.create_task(_warm_up_model())
+
+async def stop_inference():
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+    await batcher.stop()
+    await run_in_threadpool(inference_pool.shutdown)
+
+def priority_for(user: Optional[User]) -> int:
+    return PRIORITY_STAFF if user is not None and user.is_superuser else PRIORITY_CUSTOMER
+
+def deadline_for(timeout_ms: Optional[float], default_ms: Optional[float] = AI_DEFAULT_DEADLINE_MS) -> Optional[float]:
+    # As a time.perf_counter() value, which is what the batcher compares
+    if timeout_ms is None:
+        timeout_ms = default_ms
+    if timeout_ms is None:
+        return None
+    return time.perf_counter() + min(timeout_ms, AI_MAX_DEADLINE_MS) / 1000
+
+def _busy(e: Overloaded):
+    return HTTPException(status_code=503, detail=f"{e}, please retry", headers={"Retry-After": str(e.retry_after)})
+
+async def analyze_contents(contents: bytes, priority: int = PRIORITY_CUSTOMER, deadline: Optional[float] = None):
+    """
+    Cache lookup, then batched inference. Raises ValueError for uploads
+    that are not decodable images, and Overloaded when admission control
+    turns the photo away (cached results are still served).
+    """
+    cache_key = ResultCache.key_for(contents, MODEL_VERSION, CONFIDENCE_THRESHOLD)
+    cached = await result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    result = await batcher.submit(contents, priority=priority, deadline=deadline)
+    await result_cache.set(cache_key, result)
+    logger.debug("Analysis result: %s", result)
+    return result
+
+@router.post("/analyze")
+async def analyze_laundry(
+    file: UploadFile = File(...),
+    timeout_ms: Optional[float] = Header(None, alias=DEADLINE_HEADER),
+    user: Optional[User] = Depends(get_optional_user),
+):
+    deadline = deadline_for(timeout_ms)
+    contents = await read_upload(file, AI_MAX_UPLOAD_BYTES)
+    try:
+        return await analyze_contents(contents, priority_for(user), deadline)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Could not decode image")
+    except Overloaded as e:
+        raise _busy(e)
+
+def _too_large(detail: str):
+    return HTTPException(status_code=413, detail=detail)
+
+class UnreadableEntry(Exception):
+    """An archive entry that could not be extracted; it gets an error line."""
+
+# What extracting one entry can raise: encryption (RuntimeError), an
+# unsupported compression method (NotImplementedError), a CRC mismatch
+# (BadZipFile) or a corrupt or truncated stream (zlib.error, EOFError)
+_ZIP_READ_ERRORS = (RuntimeError, NotImplementedError, zipfile.BadZipFile, zlib.error, EOFError)
+
+def _read_entry(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> Union[bytes, UnreadableEntry]:
+    try:
+        return archive.read(info)
+    except _ZIP_READ_ERRORS as e:
+        logger.info("Unreadable zip entry %s: %s", info.filename, e)
+        return UnreadableEntry("Could not extract file from archive")
+
+def _expand_zip(filename: str, contents: bytes, max_images: int, max_bytes: int) -> List[Tuple[str, Union[bytes, UnreadableEntry]]]:
+    """
+    Pulls the files out of an uploaded archive. Sizes come from the zip
+    directory and are checked before anything is decompressed. An entry
+    that cannot be extracted comes back as an UnreadableEntry in place of
+    its bytes.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(contents))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail=f"{filename} is not a valid zip archive")
+    entries = [info for info in archive.infolist() if not info.is_dir()]
+    if len(entries) > max_images:
+        raise _too_large(f"Too many images (limit {AI_BATCH_MAX_IMAGES})")
+    if sum(info.file_size for info in entries) > max_bytes:
+        raise _too_large(f"Upload too large (limit {AI_BATCH_MAX_BYTES} bytes)")
+    return [(f"{filename}/{info.filename}", _read_entry(archive, info)) for info in entries]
+
+async def _collect_images(files: List[UploadFile]) -> List[Tuple[str, Union[bytes, UnreadableEntry]]]:
+    images: List[Tuple[str, Union[bytes, UnreadableEntry]]] = []
+    total_bytes = 0
+    for upload in files:
+        contents = await read_upload(upload, AI_BATCH_MAX_BYTES - total_bytes, allow_zip=True)
+        if contents.startswith(ZIP_SIGNATURE):
+            expanded = await run_in_threadpool(
+                _expand_zip,
+                upload.filename,
+                contents,
+                AI_BATCH_MAX_IMAGES - len(images),
+                AI_BATCH_MAX_BYTES - total_bytes,
+            )
+        else:
+            expanded = [(upload.filename, contents)]
+        images.extend(expanded)
+        total_bytes += sum(len(data) for _, data in expanded if isinstance(data, bytes))
+        if len(images) > AI_BATCH_MAX_IMAGES:
+            raise _too_large(f"Too many images (limit {AI_BATCH_MAX_IMAGES})")
+        if total_bytes > AI_BATCH_MAX_BYTES:
+            raise _too_large(f"Upload too large (limit {AI_BATCH_MAX_BYTES} bytes)")
+    return images
+
+async def _analyze_indexed(
+    index: int, filename: str, contents: Union[bytes, UnreadableEntry], priority: int, deadline: Optional[float]
+) -> dict:
+    line = {"index": index, "filename": filename}
+    if isinstance(contents, UnreadableEntry):
+        line["error"] = str(contents)
+        return line
+    # Headers are already sent by the time this runs, so every failure has
+    # to become an error line; an exception would truncate the stream
+    try:
+        line.update(await analyze_contents(contents, priority, deadline))
+    except ValueError:
+        line["error"] = "Could not decode image"
+    except Overloaded as e:
+        # Queue full, displaced, or DeadlineExceeded
+        line["error"] = str(e)
+    except Exception:
+        logger.exception("Analysis failed for %s", filename)
+        line["error"] = "Analysis failed"
+    return line
+
+@router.post("/analyze/batch")
+async def analyze_laundry_batch(
+    files: List[UploadFile] = File(...),
+    timeout_ms: Optional[float] = Header(None, alias=DEADLINE_HEADER),
+    user: Optional[User] = Depends(get_optional_user),
+):
+    """
+    Analyzes many photos (or zip archives of photos) in one request.
+    Responds with NDJSON: one line per image, written as soon as that
+    image is done, so lines can arrive out of order; `index` gives the
+    position in the upload. Results stream, so there is no default
+    deadline; with X-Request-Timeout-Ms, images not analyzed in time get
+    an error line.
+    """
+    deadline = deadline_for(timeout_ms, default_ms=None)
+    priority = priority_for(user)
+    images = await _collect_images(files)
+    # A customer batch the queue cannot take is turned away as a whole
+    # (images can still be refused individually if others get in first);
+    # a staff batch goes ahead and displaces queued customer photos
+    if not batcher.has_room(len(images)) and priority != PRIORITY_STAFF:
+        raise _busy(Overloaded("Too many requests queued", batcher.retry_after()))
+
+    async def stream():
+        # All images go to the batcher at once so they share forward passes
+        tasks = [
+            asyncio.create_task(_analyze_indexed(i, filename, contents, priority, deadline))
+            for i, (filename, contents) in enumerate(images)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away: don't keep inferring for nobody
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
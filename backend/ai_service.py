@@ -1,75 +1,175 @@
-from ultralytics import YOLO
-import shutil
+import io
+import logging
+import numpy as np
 import os
-from typing import Dict
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Union
+from PIL import Image
+from .inference_backends import Detection, Timings, load_backend
+from .model_config import AI_BACKEND, AI_INPUT_SIZE, CONFIDENCE_THRESHOLD, TRAINED_MODEL_PATH, served_model_path
 
-# Load model (will auto-download from HF on first run if configured, 
-# or we point to the specific HF file)
-# Since Ultralytics supports HF direct loading:
-# Using standard YOLOv8n model as fallback since custom weights URL is down
-# "yolov8n.pt" will be downloaded automatically from Ultralytics
-# Check for custom trained model, else fallback to standard
-trained_model_path = os.path.join(os.getcwd(), "runs", "detect", "train3", "weights", "best.pt")
-if os.path.exists(trained_model_path):
-    print(f"Loading custom trained model from: {trained_model_path}")
-    model = YOLO(trained_model_path)
-else:
-    print("Custom model not found, loading standard YOLOv8n...")
-    model = YOLO("yolov8n.pt")
+logger = logging.getLogger(__name__)
 
-def analyze_image_file(file_path: str) -> Dict[str, str]:
+# The model (and ultralytics/torch or onnxruntime behind it) is loaded on
+# first use rather than at import, so importing this module stays cheap for
+# the API process, --reload cycles and utility scripts.
+_backend = None
+_backend_lock = threading.Lock()
+_warmup_timings: Optional[Dict[str, float]] = None
+
+def get_backend():
     """
-    Analyzes an image file for clothing defects.
-    Returns a dictionary with result details.
+    Returns the inference backend selected by AI_BACKEND, loading it on
+    first call.
     """
-    # Run inference (Lower confidence to catch distinct features)
-    results = model.predict(source=file_path, save=False, conf=0.10)
-    
-    print(f"AI Debug: Raw Results for {file_path}: {results}")
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                # Load model (will auto-download from HF on first run if configured,
+                # or we point to the specific HF file)
+                # Since Ultralytics supports HF direct loading:
+                # Using standard YOLOv8n model as fallback since custom weights URL is down
+                source = served_model_path()
+                if AI_BACKEND != "torch":
+                    logger.info("Loading %s model from: %s", AI_BACKEND, source)
+                elif source == TRAINED_MODEL_PATH:
+                    logger.info("Loading custom trained model from: %s", source)
+                else:
+                    logger.warning("Custom model not found, loading standard YOLOv8n")
+                # Inference workers export their thread cap via OMP_NUM_THREADS
+                threads = int(os.getenv("OMP_NUM_THREADS", 0)) or None
+                _backend = load_backend(AI_BACKEND, source, threads=threads, imgsz=AI_INPUT_SIZE)
+    return _backend
 
-    detected_class = "Normal"
-    recommendation = "Wash & Fold"
-    confidence = 0.0
+def warm_up() -> Dict[str, float]:
+    """
+    Loads the model and runs one inference on a synthetic image so the
+    first real request does not pay for lazy initialisation inside the
+    runtime. Returns the timings; later calls return the first call's numbers.
+    """
+    global _warmup_timings
+    if _warmup_timings is None:
+        start = time.perf_counter()
+        backend = get_backend()
+        loaded = time.perf_counter()
+        image = np.full((AI_INPUT_SIZE, AI_INPUT_SIZE, 3), 127, dtype=np.uint8)
+        backend.detect([image], CONFIDENCE_THRESHOLD)
+        done = time.perf_counter()
+        _warmup_timings = {
+            "model_load_seconds": loaded - start,
+            "first_inference_seconds": done - loaded,
+        }
+    return _warmup_timings
 
-    # Check results
-    for result in results:
-        if result.boxes:
-            # Get the box with highest confidence
-            box = result.boxes[0]
-            class_id = int(box.cls[0])
-            confidence = float(box.conf[0])
-            label = model.names[class_id]
-            
-            detected_class = label
-            
-            # Map labels to recommendations
-            # Labels: outside_tear, stain, tear, hole, normal
-            if label == "stain":
-                recommendation = "Dry Cleaning"
-            elif label in ["tear", "outside_tear", "hole"]:
-                recommendation = "Special Care"
-            else:
-                recommendation = "Wash & Fold"
-            
-            # Break after finding first major defect (prioritize defects over normal)
-            break
-            
+def preload_for_fork() -> bool:
+    """
+    For a pre-fork server's master process: loads and warms the model
+    before the workers are forked, so they all share its memory
+    copy-on-write instead of each loading a copy. Runs on one thread, so
+    no intra-op thread pool exists yet to be lost in the fork; workers set
+    their own thread count afterwards. ONNX Runtime sessions start their
+    thread pools when created, so with the ONNX backends each worker
+    still loads its own (small) model. Returns whether the model was loaded.
+    """
+    if AI_BACKEND != "torch":
+        return False
+    from .inference_pool import _configure_threads
+    _configure_threads(1)
+    warm_up()
+    return True
+
+def recommendation_for(label: str) -> str:
+    """
+    Maps a detected label to a service recommendation.
+    Labels: outside_tear, stain, tear, hole, normal
+    """
+    if label == "stain":
+        return "Dry Cleaning"
+    elif label in ["tear", "outside_tear", "hole"]:
+        return "Special Care"
+    return "Wash & Fold"
+
+def summarize_detection(detection: Detection) -> Dict[str, str]:
+    """
+    Turns the most confident detection in an image into the API response shape.
+    """
+    if detection is None:
+        return {
+            "detected_defect": "Normal",
+            "confidence": f"{0.0:.2f}",
+            "recommendation": "Wash & Fold"
+        }
+    label, confidence = detection
     return {
-        "detected_defect": detected_class,
+        "detected_defect": label,
         "confidence": f"{confidence:.2f}",
-        "recommendation": recommendation
+        "recommendation": recommendation_for(label)
     }
 
-def analyze_image_bytes(image_bytes: bytes) -> Dict[str, str]:
-    # Save bytes to temp file because YOLO expects file or numpy array
-    temp_filename = "temp_upload_image.jpg"
-    with open(temp_filename, "wb") as f:
-        f.write(image_bytes)
-        
+def analyze_image_file(file_path: str) -> Dict[str, str]:
+    """
+    Analyzes an image file for clothing defects.
+    Returns a dictionary with result details.
+    """
+    with open(file_path, "rb") as f:
+        image = decode_image(f.read())
+    detection = get_backend().detect([image], CONFIDENCE_THRESHOLD)[0]
+    return summarize_detection(detection)
+
+def decode_image(image_bytes: Union[bytes, bytearray, memoryview], max_size: int = AI_INPUT_SIZE) -> np.ndarray:
+    """
+    Decodes an encoded image (JPEG, PNG, ...) from memory into the BGR array
+    the backends expect, no larger than `max_size` on its longest side.
+    For JPEGs, draft mode makes the decoder itself scale by 1/2, 1/4 or 1/8,
+    so a 12 MP phone photo is never materialised at full resolution.
+    """
     try:
-        result = analyze_image_file(temp_filename)
-        return result
-    finally:
-        # Cleanup
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image.draft("RGB", (max_size, max_size))
+            image = image.convert("RGB")
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise ValueError("Could not decode image")
+    # Only ever shrinks; the backend letterboxes to its own input size
+    image.thumbnail((max_size, max_size), Image.BILINEAR)
+    return np.ascontiguousarray(np.asarray(image)[..., ::-1])
+
+def analyze_images_bytes(images: List[bytes], timings: Timings = None) -> List[Union[Dict[str, str], Exception]]:
+    """
+    Analyzes several uploads with a single batched forward pass.
+    Results are returned in the same order as `images`; an upload that
+    cannot be decoded gets a ValueError in its slot instead of failing
+    the whole batch. If `timings` is given, seconds spent per stage
+    ("decode" plus the backend's stages) are added to it.
+    """
+    results: List[Union[Dict[str, str], Exception]] = [None] * len(images)
+    decoded = []
+    positions = []
+    start = time.perf_counter()
+    for i, image_bytes in enumerate(images):
+        try:
+            decoded.append(decode_image(image_bytes))
+            positions.append(i)
+        except ValueError as e:
+            results[i] = e
+    if timings is not None:
+        timings["decode"] = timings.get("decode", 0.0) + time.perf_counter() - start
+
+    if decoded:
+        detections = get_backend().detect(decoded, CONFIDENCE_THRESHOLD, timings)
+        for i, detection in zip(positions, detections):
+            results[i] = summarize_detection(detection)
+    return results
+
+def analyze_image_bytes(image_bytes: bytes) -> Dict[str, str]:
+    result = analyze_images_bytes([image_bytes])[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+if __name__ == "__main__":
+    # CLI: python -m backend.ai_service <image> [<image> ...]
+    for path in sys.argv[1:]:
+        print(path, analyze_image_file(path))
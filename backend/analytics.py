@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import column, func, select, table, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .auth import get_current_user
+from .database import async_engine, engine, get_async_session
+from .metrics import Counter, Gauge, Histogram
+from .models import AnalyticsSummary, DailyStat, ServiceStat, SlotStat, StatusCount, User
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+logger = logging.getLogger(__name__)
+
+# Dashboard numbers come from order_daily_rollup, a materialized view with
+# one row per (created day, pickup day, service, status, time slot). Its
+# size depends on the number of distinct days and categories, not on the
+# number of orders, so these endpoints stay fast however long the order
+# history gets. The view is refreshed every ANALYTICS_REFRESH_SECONDS;
+# figures can be that far behind the orders table.
+
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", 300))
+ANALYTICS_REFRESH_TIMEOUT_MS = int(os.getenv("ANALYTICS_REFRESH_TIMEOUT_MS", 120000))
+ANALYTICS_DEFAULT_DAYS = 30
+# Advisory lock id so only one API process refreshes at a time
+_REFRESH_LOCK_KEY = 0x0FDA11
+
+ROLLUP_VIEW = "order_daily_rollup"
+
+_CREATE_ROLLUP = f"""
+CREATE MATERIALIZED VIEW IF NOT EXISTS {ROLLUP_VIEW} AS
+SELECT
+    created_at::date AS day,
+    pickup_date::date AS pickup_day,
+    service,
+    status,
+    time_slot,
+    count(*) AS orders,
+    coalesce(sum(amount), 0) AS revenue,
+    coalesce(sum(items_count), 0) AS items_count
+FROM "order"
+GROUP BY 1, 2, 3, 4, 5
+"""
+# REFRESH ... CONCURRENTLY needs a unique index, and keeps the view
+# readable while it runs
+_CREATE_ROLLUP_INDEX = f"""
+CREATE UNIQUE INDEX IF NOT EXISTS ux_{ROLLUP_VIEW}
+ON {ROLLUP_VIEW} (day, pickup_day, service, status, time_slot)
+"""
+
+rollup = table(
+    ROLLUP_VIEW,
+    column("day"),
+    column("pickup_day"),
+    column("service"),
+    column("status"),
+    column("time_slot"),
+    column("orders"),
+    column("revenue"),
+    column("items_count"),
+)
+
+REFRESH_SECONDS = Histogram(
+    "analytics_refresh_seconds",
+    "Time to refresh the order rollup view",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+LAST_REFRESH = Gauge("analytics_last_refresh_timestamp", "Unix time of the last rollup refresh", multiprocess="max")
+REFRESH_ERRORS = Counter("analytics_refresh_errors_total", "Rollup refreshes that failed")
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def create_rollup_view():
+    with engine.begin() as conn:
+        conn.execute(text(_CREATE_ROLLUP))
+        conn.execute(text(_CREATE_ROLLUP_INDEX))
+
+
+async def refresh_rollup() -> bool:
+    """
+    Refreshes the rollup unless another process is already doing it.
+    Returns whether this call did the refresh.
+    """
+    start = time.perf_counter()
+    async with async_engine.begin() as conn:
+        locked = (await conn.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _REFRESH_LOCK_KEY}
+        )).scalar()
+        if not locked:
+            return False
+        # Refreshing can outlast the API's default statement timeout
+        await conn.execute(text(f"SET LOCAL statement_timeout = {ANALYTICS_REFRESH_TIMEOUT_MS}"))
+        await conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {ROLLUP_VIEW}"))
+    REFRESH_SECONDS.observe(time.perf_counter() - start)
+    LAST_REFRESH.set(time.time())
+    return True
+
+
+async def _refresh_periodically():
+    while True:
+        await asyncio.sleep(ANALYTICS_REFRESH_SECONDS)
+        try:
+            await refresh_rollup()
+        except Exception:
+            REFRESH_ERRORS.inc()
+            logger.exception("Rollup refresh failed")
+
+
+def start_refresh():
+    global _refresh_task
+    if _refresh_task is None and ANALYTICS_REFRESH_SECONDS > 0:
+        _refresh_task = asyncio.create_task(_refresh_periodically())
+
+
+async def stop_refresh():
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
+
+
+def require_admin(current_user: User = Depends(get_current_user)) -> User:
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return current_user
+
+
+def _date_range(start: Optional[date], end: Optional[date]):
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return start, end
+
+
+@router.get("/summary", response_model=AnalyticsSummary)
+async def summary(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(require_admin),
+):
+    start, end = _date_range(start, end)
+    statement = (
+        select(rollup.c.status, func.sum(rollup.c.orders), func.sum(rollup.c.revenue), func.sum(rollup.c.items_count))
+        .where(rollup.c.day.between(start, end))
+        .group_by(rollup.c.status)
+        .order_by(rollup.c.status)
+    )
+    rows = (await session.execute(statement)).all()
+    return AnalyticsSummary(
+        orders=int(sum(row[1] for row in rows)),
+        revenue=float(sum(row[2] for row in rows)),
+        items=int(sum(row[3] for row in rows)),
+        by_status=[StatusCount(status=row[0], orders=int(row[1])) for row in rows],
+    )
+
+
+@router.get("/daily", response_model=List[DailyStat])
+async def daily(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    service: Optional[str] = None,
+    by_service: bool = False,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(require_admin),
+):
+    start, end = _date_range(start, end)
+    keys = [rollup.c.day, rollup.c.service] if by_service else [rollup.c.day]
+    statement = (
+        select(*keys, func.sum(rollup.c.orders), func.sum(rollup.c.revenue), func.sum(rollup.c.items_count))
+        .where(rollup.c.day.between(start, end))
+        .group_by(*keys)
+        .order_by(*keys)
+    )
+    if service is not None:
+        statement = statement.where(rollup.c.service == service)
+    rows = (await session.execute(statement)).all()
+    return [
+        DailyStat(
+            day=row[0],
+            service=row[1] if by_service else service,
+            orders=int(row[-3]),
+            revenue=float(row[-2]),
+            items=int(row[-1]),
+        )
+        for row in rows
+    ]
+
+
+@router.get("/services", response_model=List[ServiceStat])
+async def services(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(require_admin),
+):
+    start, end = _date_range(start, end)
+    statement = (
+        select(rollup.c.service, func.sum(rollup.c.orders), func.sum(rollup.c.revenue), func.sum(rollup.c.items_count))
+        .where(rollup.c.day.between(start, end))
+        .group_by(rollup.c.service)
+        .order_by(func.sum(rollup.c.revenue).desc())
+    )
+    rows = (await session.execute(statement)).all()
+    return [ServiceStat(service=row[0], orders=int(row[1]), revenue=float(row[2]), items=int(row[3])) for row in rows]
+
+
+@router.get("/pickup-slots", response_model=List[SlotStat])
+async def pickup_slots(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(require_admin),
+):
+    """
+    Pickup volume per day and time slot; the range applies to the pickup
+    date, so future days show the bookings already made.
+    """
+    start, end = _date_range(start, end)
+    statement = (
+        select(rollup.c.pickup_day, rollup.c.time_slot, func.sum(rollup.c.orders))
+        .where(rollup.c.pickup_day.between(start, end))
+        .group_by(rollup.c.pickup_day, rollup.c.time_slot)
+        .order_by(rollup.c.pickup_day, rollup.c.time_slot)
+    )
+    rows = (await session.execute(statement)).all()
+    return [SlotStat(pickup_day=row[0], time_slot=row[1], orders=int(row[2])) for row in rows]
+
+
+@router.post("/refresh")
+async def refresh(current_user: User = Depends(require_admin)):
+    refreshed = await refresh_rollup()
+    return {"refreshed": refreshed}
@@ -1,12 +1,17 @@
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+import time
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlmodel import Session, select
-from .models import User, UserCreate, UserRead, Token, UserLogin
-from .database import engine, get_session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .cache import CACHE_HITS, CACHE_MISSES, TTLCache
+from .metrics import Gauge
+from .models import USER_CHANGED_EVENT, User, UserCreate, UserRead, Token, UserLogin, user_changed_hooks
+from .database import async_session_factory, get_async_session
+from .events import broker
+from .passwords import hash_password, verify_password
 import os
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -16,14 +21,39 @@ SECRET_KEY = "CHANGE_THIS_TO_A_SECURE_RANDOM_KEY_LATER" # TODO: Move to .env
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Caches for get_current_user. Flag changes made through the ORM, by this
+# process or any other (workers, replicas, scripts such as create_admin.py),
+# invalidate a cached user straight away; across processes this needs
+# EVENTS_BROKER=postgres. Changes made outside the ORM (raw SQL) show up
+# within AUTH_USER_CACHE_TTL seconds.
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", 10000))
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", 30))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 10000))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
+
+# token -> verified payload, so repeat requests skip signature verification
+_token_cache = TTLCache(AUTH_TOKEN_CACHE_SIZE, ACCESS_TOKEN_EXPIRE_MINUTES * 60, name="auth_token")
+# subject (email) -> detached User, so repeat requests skip the user query
+_user_cache = TTLCache(AUTH_USER_CACHE_SIZE, AUTH_USER_CACHE_TTL, name="auth_user")
+
+AUTH_CACHE_HIT_RATIO = Gauge(
+    "auth_cache_hit_ratio", "Share of get_current_user lookups served from cache", ["cache"], multiprocess="all"
+)
+
+def _update_hit_ratio(cache: TTLCache):
+    hits = CACHE_HITS.value(cache=cache.name, tier="memory")
+    lookups = hits + CACHE_MISSES.value(cache=cache.name)
+    AUTH_CACHE_HIT_RATIO.set(hits / lookups if lookups else 0.0, cache=cache.name)
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def invalidate_cached_user(email: str):
+    _user_cache.pop(email)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# Flag changes (see models.user_changed_hooks) from this process, and from
+# any other via the broker
+user_changed_hooks.append(invalidate_cached_user)
+broker.handle(USER_CHANGED_EVENT, lambda event: invalidate_cached_user(event.data["email"]))
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -35,40 +65,50 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# get_session imported from database
+# get_async_session imported from database
 
 @router.post("/signup", response_model=UserRead)
-def signup(user: UserCreate, session: Session = Depends(get_session)):
+async def signup(user: UserCreate, session: AsyncSession = Depends(get_async_session)):
     # Check if user exists
     statement = select(User).where(User.email == user.email)
-    existing_user = session.exec(statement).first()
+    existing_user = (await session.exec(statement)).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password(user.password)
     new_user = User(
         email=user.email,
         full_name=user.full_name,
         hashed_password=hashed_password
     )
     session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
+    await session.commit()
+    await session.refresh(new_user)
     return new_user
 
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(get_async_session)):
     # Find user
     statement = select(User).where(User.email == form_data.username)
-    user = session.exec(statement).first()
+    user = (await session.exec(statement)).first()
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await verify_password(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    # Stored hash used older Argon2 parameters: upgrade it now that we
+    # have the plaintext
+    if new_hash:
+        user.hashed_password = new_hash
+        session.add(user)
+        await session.commit()
     
     # Generate token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -77,26 +117,69 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Sessi
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-async def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)):
+async def get_current_user(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_async_session)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    payload = _token_cache.get(token)
+    _update_hit_ratio(_token_cache)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
             raise credentials_exception
-    except JWTError:
+        # Never keep a token cached past its own expiry
+        _token_cache.set(token, payload, ttl=payload.get("exp", 0) - time.time())
+    elif payload.get("exp", 0) <= time.time():
         raise credentials_exception
-    
-    statement = select(User).where(User.email == email)
-    user = session.exec(statement).first()
-    if user is None:
+
+    email: str = payload.get("sub")
+    if email is None:
         raise credentials_exception
+
+    user = _user_cache.get(email)
+    _update_hit_ratio(_user_cache)
+    if user is None:
+        statement = select(User).where(User.email == email)
+        user = (await session.exec(statement)).first()
+        if user is None:
+            raise credentials_exception
+        # Cache a detached copy: the loaded instance belongs to this
+        # request's session and must not be shared across requests
+        user = User(**user.model_dump())
+        _user_cache.set(email, user)
     return user
 
+async def get_stream_user(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    access_token: Optional[str] = Query(None),
+):
+    """
+    get_current_user for long-lived streams. Browsers' EventSource cannot
+    set headers, so the token may also come as ?access_token=. Uses its
+    own short session: a request-scoped one would hold a pooled
+    connection for as long as the stream stays open.
+    """
+    async with async_session_factory() as session:
+        return await get_current_user(token or access_token or "", session)
+
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme)) -> Optional[User]:
+    """
+    The signed-in user for endpoints that are also open to anonymous
+    callers, or None (no token, or one that does not validate). Like
+    get_stream_user it uses its own short session, so no connection is
+    held while the endpoint works.
+    """
+    if not token:
+        return None
+    async with async_session_factory() as session:
+        try:
+            return await get_current_user(token, session)
+        except HTTPException:
+            return None
+
 @router.get("/me", response_model=UserRead)
 async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
@@ -0,0 +1,270 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .metrics import Counter, Gauge, Histogram
+
+QUEUE_DEPTH = Gauge("ai_batch_queue_depth", "Requests waiting to be placed in a batch", ["batcher"])
+BATCH_SIZE = Histogram(
+    "ai_batch_size",
+    "Number of items per batched forward pass",
+    ["batcher"],
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+BATCH_WAIT = Histogram(
+    "ai_batch_wait_seconds",
+    "Time an item spent queued before its batch was dispatched",
+    ["batcher"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+SHED = Counter(
+    "ai_batch_shed_total",
+    "Items refused or dropped before processing (queue_full, evicted, deadline)",
+    ["batcher", "reason"],
+)
+
+
+class Overloaded(Exception):
+    """
+    The item was not processed because the batcher is saturated.
+    `retry_after` is a rough number of seconds until it has room again.
+    """
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Overloaded):
+    """The item could no longer be processed before its deadline."""
+
+
+class _Pending:
+    __slots__ = ("item", "future", "enqueued_at", "deadline")
+
+    def __init__(self, item: Any, future: asyncio.Future, deadline: Optional[float]):
+        self.item = item
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.deadline = deadline
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from concurrent requests and hands them to
+    `process_batch` in groups of up to `max_batch_size`, waiting at most
+    `max_wait_ms` after the first item arrives before dispatching.
+
+    `process_batch` is a coroutine function taking a list of items and
+    returning a list of results in the same order; an exception instance
+    in a result slot is raised to that item's caller only. Up to
+    `max_concurrent_batches` batches are in flight at once, so a pool of N
+    inference workers can be kept busy.
+
+    Admission control: at most `max_pending` items wait at once (0 for no
+    limit), and `submit` raises Overloaded straight away beyond that.
+    Lower `priority` values are batched first, and a full queue makes room
+    for one by dropping the newest item of the lowest priority waiting.
+    An item with a `deadline` (a time.perf_counter() value) is dropped
+    with DeadlineExceeded, rather than processed, once its batch could not
+    finish in time going by recent batch durations.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        max_concurrent_batches: int = 1,
+        max_pending: int = 0,
+        name: str = "default",
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self.max_pending = max(0, max_pending)
+        self.name = name
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._pending: Dict[int, deque] = {}
+        self._count = 0
+        self._arrived: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+        # Moving average of process_batch's duration, for deadlines and
+        # Retry-After
+        self._batch_seconds = 0.0
+
+    @property
+    def pending(self) -> int:
+        return self._count
+
+    def retry_after(self) -> int:
+        # Seconds to work through the current backlog, at least one
+        batches = math.ceil(self._count / self.max_batch_size / self.max_concurrent_batches)
+        return max(1, math.ceil(batches * self._batch_seconds))
+
+    def has_room(self, count: int) -> bool:
+        return not self.max_pending or self._count + count <= self.max_pending
+
+    async def start(self):
+        if self._task is None:
+            self._arrived = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        # Fail anything still queued rather than leaving callers hanging
+        for queue in self._pending.values():
+            for entry in queue:
+                if not entry.future.done():
+                    entry.future.set_exception(RuntimeError("Batcher stopped"))
+        self._pending.clear()
+        self._count = 0
+        QUEUE_DEPTH.set(0, batcher=self.name)
+
+    async def submit(self, item: Any, priority: int = 0, deadline: Optional[float] = None) -> Any:
+        if self._task is None:
+            raise RuntimeError("Batcher is not running")
+        if self.max_pending and self._count >= self.max_pending and not self._evict_below(priority):
+            SHED.inc(batcher=self.name, reason="queue_full")
+            raise Overloaded("Too many requests queued", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        entry = _Pending(item, future, deadline)
+        queue = self._pending.setdefault(priority, deque())
+        queue.append(entry)
+        self._count += 1
+        self._arrived.set()
+        QUEUE_DEPTH.set(self._count, batcher=self.name)
+        try:
+            if deadline is None:
+                return await future
+            # Answer at the deadline even if the item is still queued
+            # (behind higher priorities, say)
+            try:
+                return await asyncio.wait_for(future, max(0.0, deadline - time.perf_counter()))
+            except asyncio.TimeoutError:
+                SHED.inc(batcher=self.name, reason="deadline")
+                raise DeadlineExceeded("Deadline passed before processing", self.retry_after())
+        finally:
+            # Timed out or the caller went away while still queued: free
+            # the place now rather than when the batcher reaches it
+            if not future.done() or future.cancelled():
+                try:
+                    queue.remove(entry)
+                    self._count -= 1
+                    QUEUE_DEPTH.set(self._count, batcher=self.name)
+                except ValueError:
+                    pass
+
+    def _evict_below(self, priority: int) -> bool:
+        # Drops the newest item of the lowest priority below `priority`;
+        # it has waited least, so its caller loses least
+        for lower in sorted(self._pending, reverse=True):
+            if lower <= priority:
+                break
+            queue = self._pending[lower]
+            while queue:
+                entry = queue.pop()
+                self._count -= 1
+                if not entry.future.done():
+                    SHED.inc(batcher=self.name, reason="evicted")
+                    entry.future.set_exception(Overloaded("Displaced by a higher-priority request", self.retry_after()))
+                    return True
+        return False
+
+    def _next(self) -> Optional[_Pending]:
+        # The next item worth processing, highest priority first. Items
+        # whose caller has gone are skipped; items that would finish past
+        # their deadline are dropped.
+        finish = time.perf_counter() + self._batch_seconds
+        for priority in sorted(self._pending):
+            queue = self._pending[priority]
+            while queue:
+                entry = queue.popleft()
+                self._count -= 1
+                if entry.future.done():
+                    continue
+                if entry.deadline is not None and finish > entry.deadline:
+                    SHED.inc(batcher=self.name, reason="deadline")
+                    entry.future.set_exception(DeadlineExceeded("Deadline passed before processing", self.retry_after()))
+                    continue
+                return entry
+        return None
+
+    async def _collect(self) -> List[_Pending]:
+        entry = self._next()
+        while entry is None:
+            self._arrived.clear()
+            await self._arrived.wait()
+            entry = self._next()
+        batch = [entry]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            entry = self._next()
+            if entry is not None:
+                batch.append(entry)
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        QUEUE_DEPTH.set(self._count, batcher=self.name)
+        return batch
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[_Pending]):
+        try:
+            now = time.perf_counter()
+            BATCH_SIZE.observe(len(batch), batcher=self.name)
+            for entry in batch:
+                BATCH_WAIT.observe(now - entry.enqueued_at, batcher=self.name)
+
+            try:
+                results = await self.process_batch([entry.item for entry in batch])
+            except Exception as e:
+                for entry in batch:
+                    if not entry.future.done():
+                        entry.future.set_exception(e)
+                return
+            finally:
+                elapsed = time.perf_counter() - now
+                self._batch_seconds = elapsed if not self._batch_seconds else 0.8 * self._batch_seconds + 0.2 * elapsed
+
+            for entry, result in zip(batch, results):
+                if entry.future.done():
+                    continue
+                # Per-item failures come back as exception instances
+                if isinstance(result, Exception):
+                    entry.future.set_exception(result)
+                else:
+                    entry.future.set_result(result)
+        finally:
+            self._slots.release()
@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import random
+import time
+
+from .batcher import MicroBatcher, Overloaded
+
+# Goodput of the /ai/analyze batcher under overload, without admission
+# control (unbounded queue, no deadlines or priorities: how it behaved
+# before) and with it. Inference is simulated by sleeping --batch-ms per
+# batch, so capacity is known exactly. Requests arrive at random at --load
+# times capacity; each client gives up after --client-timeout, but, as
+# with HTTP, the server does not notice and finishes the work anyway.
+# Goodput counts answers that reached their client in time; "wasted"
+# counts photos inferred for clients that had already left.
+#
+#   python -m backend.bench_admission --load 2 --duration 20
+
+PRIORITY_STAFF, PRIORITY_CUSTOMER = 0, 1
+
+
+async def run_mode(admission: bool, args) -> dict:
+    processed = 0
+
+    async def process_batch(items):
+        nonlocal processed
+        await asyncio.sleep(args.batch_ms / 1000)
+        processed += len(items)
+        return items
+
+    batcher = MicroBatcher(
+        process_batch,
+        max_batch_size=args.batch_size,
+        max_wait_ms=10,
+        max_pending=args.max_pending if admission else 0,
+        name="bench",
+    )
+    await batcher.start()
+    capacity = args.batch_size / (args.batch_ms / 1000)
+    rate = capacity * args.load
+    rng = random.Random(args.seed)
+    outcomes = {"ok": [], "ok_staff": [], "late": 0, "refused": 0, "requests": 0}
+    server_tasks = []
+
+    async def client(staff: bool):
+        start = time.perf_counter()
+        deadline = start + args.client_timeout if admission else None
+        priority = PRIORITY_STAFF if staff and admission else PRIORITY_CUSTOMER
+        # The handler keeps going when the client leaves
+        task = asyncio.create_task(batcher.submit(None, priority=priority, deadline=deadline))
+        server_tasks.append(task)
+        try:
+            await asyncio.wait_for(asyncio.shield(task), args.client_timeout)
+        except asyncio.TimeoutError:
+            outcomes["late"] += 1
+            return
+        except Overloaded:
+            outcomes["refused"] += 1
+            return
+        outcomes["ok_staff" if staff else "ok"].append(time.perf_counter() - start)
+
+    clients = []
+    end = time.perf_counter() + args.duration
+    while time.perf_counter() < end:
+        await asyncio.sleep(rng.expovariate(rate))
+        outcomes["requests"] += 1
+        clients.append(asyncio.create_task(client(rng.random() < args.staff)))
+    await asyncio.gather(*clients)
+    elapsed = time.perf_counter() - (end - args.duration)
+    processed_in_time = processed
+    await asyncio.gather(*server_tasks, return_exceptions=True)
+    await batcher.stop()
+
+    answered = outcomes["ok"] + outcomes["ok_staff"]
+    return {
+        "mode": "admission" if admission else "unbounded",
+        "offered": outcomes["requests"] / args.duration,
+        "capacity": capacity,
+        "goodput": len(answered) / elapsed,
+        "late": outcomes["late"],
+        "refused": outcomes["refused"],
+        "wasted": processed_in_time - len(answered),
+        "p95_ms": percentile(sorted(outcomes["ok"]), 0.95) * 1000,
+        "staff_p95_ms": percentile(sorted(outcomes["ok_staff"]), 0.95) * 1000,
+    }
+
+
+def percentile(ordered, q: float) -> float:
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Goodput under overload with and without admission control")
+    parser.add_argument("--load", type=float, default=2.0, help="offered load as a multiple of capacity")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--batch-ms", type=float, default=100, help="simulated inference time per batch")
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--client-timeout", type=float, default=5.0)
+    parser.add_argument("--staff", type=float, default=0.1, help="share of requests from staff")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'offered/s':>9} {'goodput/s':>9} {'of cap':>7} {'late':>6} {'refused':>7} "
+          f"{'wasted':>6} {'p95 ms':>7} {'staff p95':>9}")
+    for admission in (False, True):
+        row = asyncio.run(run_mode(admission, args))
+        print(f"{row['mode']:<10} {row['offered']:9.1f} {row['goodput']:9.1f} {row['goodput'] / row['capacity']:7.0%} "
+              f"{row['late']:6d} {row['refused']:7d} {row['wasted']:6d} {row['p95_ms']:7.0f} {row['staff_p95_ms']:9.0f}")
+
+
+if __name__ == "__main__":
+    main()
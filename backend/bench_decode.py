@@ -0,0 +1,133 @@
+import argparse
+import glob
+import hashlib
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from .ai_service import decode_image
+
+# Compares the legacy upload path (write bytes to temp_upload_image.jpg,
+# read it back from disk at full size) with ai_service.decode_image, the
+# in-memory decode the API serves (draft-mode JPEG scaling to AI_INPUT_SIZE).
+#
+#   python -m backend.bench_decode                 # decode only, no model needed
+#   python -m backend.bench_decode --with-model    # include the YOLO forward pass
+
+IMAGE_DIR = os.path.join(os.path.dirname(__file__), "..", "laundry_data", "images", "val")
+LEGACY_TEMP_FILE = "temp_upload_image.jpg"
+
+
+def legacy_load(image_bytes: bytes) -> np.ndarray:
+    # Same disk round-trip the old analyze_image_bytes did before predict()
+    with open(LEGACY_TEMP_FILE, "wb") as f:
+        f.write(image_bytes)
+    try:
+        return cv2.imread(LEGACY_TEMP_FILE, cv2.IMREAD_COLOR)
+    finally:
+        if os.path.exists(LEGACY_TEMP_FILE):
+            os.remove(LEGACY_TEMP_FILE)
+
+
+def memory_load(image_bytes: bytes) -> np.ndarray:
+    return decode_image(image_bytes)
+
+
+def load_images():
+    paths = sorted(glob.glob(os.path.join(IMAGE_DIR, "*.jpg")))
+    if not paths:
+        raise SystemExit(f"No images found in {IMAGE_DIR}")
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    return images
+
+
+def digest(image: np.ndarray) -> str:
+    if image is None:
+        return "unreadable"
+    return hashlib.sha1(image.tobytes()).hexdigest()
+
+
+def time_sequential(loader, images, rounds):
+    samples = []
+    for _ in range(rounds):
+        for image_bytes in images:
+            start = time.perf_counter()
+            loader(image_bytes)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def check_concurrency(loader, images, expected, threads, rounds):
+    """
+    Feeds distinct images through `loader` from many threads at once and
+    counts how often a caller got back pixels that were not its own.
+    """
+    jobs = [i % len(images) for i in range(len(images) * rounds)]
+
+    def run(i):
+        try:
+            return digest(loader(images[i])) == expected[i]
+        except Exception:
+            # A concurrent remove() can also make the legacy read fail outright
+            return False
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        outcomes = list(pool.map(run, jobs))
+    return len(outcomes) - sum(outcomes), len(outcomes)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name, samples):
+    print(
+        f"{name:<10} n={len(samples):<5} mean={statistics.mean(samples):7.3f}ms "
+        f"p50={percentile(samples, 50):7.3f}ms p99={percentile(samples, 99):7.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark legacy vs in-memory upload decoding")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--with-model", action="store_true", help="include the YOLO forward pass")
+    args = parser.parse_args()
+
+    images = load_images()
+
+    legacy, memory = legacy_load, memory_load
+    if args.with_model:
+        from . import ai_service
+        backend = ai_service.get_backend()
+
+        def legacy(image_bytes):
+            return backend.detect([legacy_load(image_bytes)], ai_service.CONFIDENCE_THRESHOLD)
+
+        def memory(image_bytes):
+            return backend.detect([memory_load(image_bytes)], ai_service.CONFIDENCE_THRESHOLD)
+
+    print(f"Latency over {len(images)} images x {args.rounds} rounds ({'decode + model' if args.with_model else 'decode only'})")
+    report("legacy", time_sequential(legacy, images, args.rounds))
+    report("memory", time_sequential(memory, images, args.rounds))
+
+    print(f"\nCorrectness with {args.threads} concurrent threads (decode only)")
+    for name, loader in (("legacy", legacy_load), ("memory", memory_load)):
+        # The two paths produce different sizes, so each is checked against
+        # its own single-threaded output
+        expected = [digest(loader(image_bytes)) for image_bytes in images]
+        wrong, total = check_concurrency(loader, images, expected, args.threads, args.rounds)
+        print(f"{name:<10} {wrong}/{total} callers received another request's image")
+
+
+if __name__ == "__main__":
+    main()
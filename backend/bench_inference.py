@@ -0,0 +1,345 @@
+import argparse
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from .ai_service import decode_image, recommendation_for
+from .inference_backends import load_backend
+from .inference_pool import _THREAD_ENV_VARS, _configure_threads
+from .model_config import AI_BACKEND, CONFIDENCE_THRESHOLD, served_model_path
+
+# Latency, throughput, memory and accuracy of the model over a labelled
+# split, for every combination of
+#   --imgsz      model input size (AI_INPUT_SIZE)
+#   --batch      images per forward pass (AI_MAX_BATCH_SIZE caps the batcher)
+#   --threads    intra-op threads per process (AI_THREADS_PER_WORKER)
+#   --processes  processes inferring at once (AI_WORKERS, or uvicorn workers
+#                each running inference in-process)
+# Every configuration runs in fresh spawned processes, so thread caps apply
+# before the runtime starts and peak memory is that configuration's alone.
+# Timed runs decode the JPEGs and infer at the serving threshold, as
+# /ai/analyze does.
+#
+# Accuracy depends on the input size only, so it is measured once per size:
+# mAP@0.5 and mAP@0.5:0.95 from a low-threshold pass (as ultralytics' val
+# does), then for each --conf the precision and recall at IoU 0.5 and how
+# often the top detection gives the same recommendation as the labels.
+#
+#   python -m backend.bench_inference
+#   python -m backend.bench_inference --imgsz 256 320 416 --batch 1 8 --threads 1 2 --processes 1 2 --json sweep.json
+
+CPUS = os.cpu_count() or 1
+DATASET_DIR = os.path.join(os.path.dirname(__file__), "..", "laundry_data")
+# Threshold for the mAP pass; the curve needs the low-confidence tail
+EVAL_CONF = 0.001
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def load_split(dataset_dir: str, split: str):
+    """
+    Returns the split's encoded images and their labels as (n, 5) arrays of
+    class id, x1, y1, x2, y2 normalized to the image. An image without a
+    label file has no objects.
+    """
+    paths = sorted(
+        path for pattern in ("*.jpg", "*.jpeg", "*.png")
+        for path in glob.glob(os.path.join(dataset_dir, "images", split, pattern))
+    )
+    images, labels = [], []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+        stem = os.path.splitext(os.path.basename(path))[0]
+        label_path = os.path.join(dataset_dir, "labels", split, stem + ".txt")
+        rows = np.loadtxt(label_path, ndmin=2) if os.path.exists(label_path) else np.zeros((0, 5))
+        rows = rows.reshape(-1, 5)
+        cls, cx, cy, w, h = rows.T
+        labels.append(np.stack([cls, cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1))
+    return images, labels
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # (n, 4) x (m, 4) xyxy -> (n, m)
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+
+def match(boxes: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """
+    Marks each predicted box (most confident first) as a true positive at
+    each IoU threshold: it takes the best-overlapping label of its class
+    that no more confident box has taken.
+    """
+    hits = np.zeros((len(boxes), len(IOU_THRESHOLDS)), dtype=bool)
+    if not len(boxes) or not len(labels):
+        return hits
+    ious = box_iou(boxes[:, :4], labels[:, 1:])
+    ious[boxes[:, 5][:, None] != labels[:, 0][None, :]] = 0
+    for t, threshold in enumerate(IOU_THRESHOLDS):
+        taken = np.zeros(len(labels), dtype=bool)
+        for i in range(len(boxes)):
+            candidates = np.flatnonzero(~taken & (ious[i] >= threshold))
+            if len(candidates):
+                taken[candidates[np.argmax(ious[i, candidates])]] = True
+                hits[i, t] = True
+    return hits
+
+
+def average_precision(recall: np.ndarray, precision: np.ndarray) -> float:
+    # COCO-style: the best precision at or beyond each of 101 recall points,
+    # zero where that recall is never reached
+    if not len(recall):
+        return 0.0
+    precision = np.flip(np.maximum.accumulate(np.flip(precision)))
+    indices = np.searchsorted(recall, np.linspace(0, 1, 101), side="left")
+    reached = indices < len(recall)
+    return float(np.mean(np.where(reached, precision[np.minimum(indices, len(recall) - 1)], 0.0)))
+
+
+def mean_average_precision(predictions, labels):
+    hits = np.concatenate([match(boxes, truth) for boxes, truth in zip(predictions, labels)])
+    confidences = np.concatenate([boxes[:, 4] for boxes in predictions])
+    classes = np.concatenate([boxes[:, 5] for boxes in predictions])
+    true_classes = np.concatenate([truth[:, 0] for truth in labels])
+    order = np.argsort(-confidences, kind="stable")
+    hits, classes = hits[order], classes[order]
+
+    per_class = []
+    for cls in np.unique(true_classes):
+        class_hits = hits[classes == cls]
+        true_positives = np.cumsum(class_hits, axis=0)
+        false_positives = np.cumsum(~class_hits, axis=0)
+        recall = true_positives / np.sum(true_classes == cls)
+        precision = true_positives / np.maximum(true_positives + false_positives, 1)
+        per_class.append([average_precision(recall[:, t], precision[:, t]) for t in range(len(IOU_THRESHOLDS))])
+    if not per_class:
+        return {"map50": None, "map50_95": None}
+    per_class = np.array(per_class)
+    return {"map50": float(per_class[:, 0].mean()), "map50_95": float(per_class.mean())}
+
+
+def expected_recommendation(truth: np.ndarray, names) -> str:
+    # What a perfect model would recommend: the largest labelled defect
+    if not len(truth):
+        return recommendation_for("normal")
+    areas = np.prod(truth[:, 3:5] - truth[:, 1:3], axis=1)
+    return recommendation_for(names[int(truth[np.argmax(areas), 0])])
+
+
+def threshold_scores(predictions, labels, names, conf: float):
+    """Precision and recall at IoU 0.5, and recommendation agreement, at `conf`."""
+    true_positives = false_positives = agreed = 0
+    for boxes, truth in zip(predictions, labels):
+        boxes = boxes[boxes[:, 4] >= conf]
+        hits = match(boxes, truth)[:, 0]
+        true_positives += int(hits.sum())
+        false_positives += int((~hits).sum())
+        label = names[int(boxes[0, 5])] if len(boxes) else "normal"
+        agreed += recommendation_for(label) == expected_recommendation(truth, names)
+    total_labels = sum(len(truth) for truth in labels)
+    return {
+        "conf": conf,
+        "precision": true_positives / max(true_positives + false_positives, 1),
+        "recall": true_positives / max(total_labels, 1),
+        "recommendation_agreement": agreed / len(labels),
+    }
+
+
+def measure(kind, config, dataset_dir, split, rounds, evaluate, barrier, results):
+    """
+    One inference process: loads the model with the configuration's input
+    size and thread cap, warms up, then (in step with the other processes
+    of the configuration) runs the split `rounds` times in batches.
+    """
+    try:
+        _configure_threads(config["threads"])
+        imgsz = config["imgsz"]
+        backend = load_backend(kind, served_model_path(kind), threads=config["threads"], imgsz=imgsz)
+        images, labels = load_split(dataset_dir, split)
+        backend.detect([decode_image(images[0], imgsz)], CONFIDENCE_THRESHOLD)
+
+        batches = [images[i:i + config["batch"]] for i in range(0, len(images), config["batch"])]
+        latencies = []
+        barrier.wait()
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for batch in batches:
+                batch_start = time.perf_counter()
+                backend.detect([decode_image(image, imgsz) for image in batch], CONFIDENCE_THRESHOLD)
+                latencies.append(time.perf_counter() - batch_start)
+        elapsed = time.perf_counter() - start
+
+        predictions = None
+        if evaluate:
+            predictions = [backend.detect_boxes([decode_image(image, imgsz)], EVAL_CONF)[0] for image in images]
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+        results.put({
+            "images": len(images) * rounds,
+            "elapsed": elapsed,
+            "latencies": latencies,
+            "peak_rss_mb": peak_mb,
+            "names": dict(backend.names),
+            "predictions": predictions,
+        })
+    except Exception as e:
+        barrier.abort()
+        results.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def run_config(kind, config, dataset_dir, split, rounds, evaluate):
+    context = multiprocessing.get_context("spawn")
+    # Inherited by the spawned processes, so BLAS and OpenMP size their
+    # pools for the cap from the start
+    for var in _THREAD_ENV_VARS:
+        os.environ[var] = str(config["threads"])
+    barrier = context.Barrier(config["processes"])
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=measure,
+            args=(kind, config, dataset_dir, split, rounds, evaluate and i == 0, barrier, results),
+        )
+        for i in range(config["processes"])
+    ]
+    for process in processes:
+        process.start()
+    # Drain before joining: a child cannot exit while its result is unread
+    outputs = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    errors = [output["error"] for output in outputs if "error" in output]
+    if errors:
+        return {"error": errors[0]}
+
+    latencies = sorted(latency * 1000 for output in outputs for latency in output["latencies"])
+    images = sum(output["images"] for output in outputs)
+    evaluated = next((output for output in outputs if output["predictions"] is not None), None)
+    return {
+        "throughput": images / max(output["elapsed"] for output in outputs),
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "ms_per_image": statistics.mean(latencies) / config["batch"],
+        "peak_rss_mb": sum(output["peak_rss_mb"] for output in outputs),
+        "names": outputs[0]["names"],
+        "predictions": evaluated["predictions"] if evaluated else None,
+    }
+
+
+def percentile(ordered, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def suggest(rows, accuracy, max_map_drop: float):
+    """
+    The fastest configuration whose input size keeps mAP@0.5 within
+    `max_map_drop` of the best size, and the threshold with the best
+    recommendation agreement at that size.
+    """
+    best_map = max((entry["map50"] or 0.0) for entry in accuracy.values())
+    eligible = [row for row in rows if (accuracy[row["imgsz"]]["map50"] or 0.0) >= best_map - max_map_drop]
+    if not eligible:
+        return None
+    fastest = max(eligible, key=lambda row: row["throughput"])
+    thresholds = accuracy[fastest["imgsz"]]["thresholds"]
+    conf = max(thresholds, key=lambda entry: (entry["recommendation_agreement"], entry["recall"]))["conf"]
+    return fastest, conf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep model input size, batch size, threads and processes")
+    parser.add_argument("--backend", default=AI_BACKEND, choices=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--dataset-dir", default=DATASET_DIR)
+    parser.add_argument("--split", default="val")
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[256, 320, 416, 640])
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({n for n in (1, 2, 4, CPUS) if n <= CPUS}))
+    parser.add_argument("--processes", type=int, nargs="+", default=[1])
+    parser.add_argument("--conf", type=float, nargs="+",
+                        default=sorted({0.05, 0.10, 0.25, 0.5, CONFIDENCE_THRESHOLD}))
+    parser.add_argument("--rounds", type=int, default=5, help="passes over the split per configuration")
+    parser.add_argument("--max-map-drop", type=float, default=0.01,
+                        help="mAP@0.5 a faster input size may lose and still be suggested")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    images, labels = load_split(args.dataset_dir, args.split)
+    if not images:
+        raise SystemExit(f"No images found in {os.path.join(args.dataset_dir, 'images', args.split)}")
+    print(f"{args.backend} model {served_model_path(args.backend)}, {len(images)} {args.split} images, "
+          f"{sum(len(truth) for truth in labels)} labelled boxes, {CPUS} CPUs")
+
+    rows, accuracy = [], {}
+    print(f"\n{'imgsz':>5} {'batch':>5} {'thr':>3} {'proc':>4} {'img/s':>7} {'p50 ms':>7} {'p95 ms':>7} "
+          f"{'p99 ms':>7} {'ms/img':>7} {'peak MB':>8}")
+    for imgsz, batch, threads, processes in itertools.product(args.imgsz, args.batch, args.threads, args.processes):
+        config = {"imgsz": imgsz, "batch": batch, "threads": threads, "processes": processes}
+        result = run_config(args.backend, config, args.dataset_dir, args.split, args.rounds, imgsz not in accuracy)
+        if "error" in result:
+            print(f"{imgsz:5d} {batch:5d} {threads:3d} {processes:4d}  skipped: {result['error']}")
+            continue
+        if result["predictions"] is not None:
+            names = {int(key): value for key, value in result["names"].items()}
+            accuracy[imgsz] = {
+                **mean_average_precision(result["predictions"], labels),
+                "thresholds": [threshold_scores(result["predictions"], labels, names, conf) for conf in args.conf],
+            }
+        row = {**config, **{key: value for key, value in result.items() if key not in ("names", "predictions")}}
+        rows.append(row)
+        print(f"{imgsz:5d} {batch:5d} {threads:3d} {processes:4d} {row['throughput']:7.1f} {row['p50_ms']:7.1f} "
+              f"{row['p95_ms']:7.1f} {row['p99_ms']:7.1f} {row['ms_per_image']:7.1f} {row['peak_rss_mb']:8.0f}")
+
+    if not rows:
+        raise SystemExit("Every configuration failed")
+
+    print(f"\n{'imgsz':>5} {'mAP50':>6} {'mAP50-95':>8} {'conf':>5} {'precision':>9} {'recall':>6} {'recommend':>9}")
+    for imgsz, entry in accuracy.items():
+        map50 = "-" if entry["map50"] is None else f"{entry['map50']:.3f}"
+        map50_95 = "-" if entry["map50_95"] is None else f"{entry['map50_95']:.3f}"
+        for i, scores in enumerate(entry["thresholds"]):
+            prefix = f"{imgsz:5d} {map50:>6} {map50_95:>8}" if i == 0 else " " * 21
+            print(f"{prefix} {scores['conf']:5.2f} {scores['precision']:9.1%} {scores['recall']:6.1%} "
+                  f"{scores['recommendation_agreement']:9.1%}")
+
+    suggestion = suggest(rows, accuracy, args.max_map_drop)
+    if suggestion:
+        best, conf = suggestion
+        print(f"\nFastest within {args.max_map_drop} mAP@0.5 of the most accurate size "
+              f"({best['throughput']:.1f} img/s, p95 {best['p95_ms']:.1f} ms per batch):")
+        print(f"  AI_INPUT_SIZE={best['imgsz']} AI_CONFIDENCE_THRESHOLD={conf:g} "
+              f"AI_THREADS_PER_WORKER={best['threads']} AI_WORKERS={best['processes']} AI_MAX_BATCH_SIZE={best['batch']}")
+        print(f"  (AI_MAX_BATCH_SIZE is a cap: batches only fill under load. "
+              f"{len(images)} images is a small sample for accuracy.)")
+
+    if args.json:
+        report = {
+            "backend": args.backend,
+            "model": served_model_path(args.backend),
+            "split": args.split,
+            "images": len(images),
+            "cpus": CPUS,
+            "rounds": args.rounds,
+            "configs": rows,
+            "accuracy": {str(imgsz): entry for imgsz, entry in accuracy.items()},
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
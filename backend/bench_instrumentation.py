@@ -0,0 +1,152 @@
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from .bench_serialization import make_rows
+from .database import ASYNC_DATABASE_URL, DATABASE_URL, time_queries
+from .http_metrics import RequestMetricsMiddleware
+from .orders import ORDER_READ_FIELDS
+from .responses import FastJSONResponse
+
+# What the metrics cost the requests they measure:
+#   http  - the same FastAPI app with and without RequestMetricsMiddleware,
+#           driven in-process through ASGI (no sockets, so the difference
+#           is not lost in network noise), for a trivial endpoint and one
+#           returning a page of 50 orders
+#   db    - SELECT 1 round-trips with and without the cursor timing hooks
+#   full  - an endpoint reading 50 orders through the async engine, with
+#           neither or both kinds of instrumentation: the share of a
+#           realistic request's time that goes to metrics
+# The db and full rows need the database; skip them with --no-db.
+#
+#   python -m backend.bench_instrumentation --requests 5000
+
+PAGE = [dict(zip(ORDER_READ_FIELDS, row)) for row in make_rows(50)]
+
+
+def build_app(instrumented: bool, engine=None) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"status": "pong"}
+
+    @app.get("/orders/{order_id}")
+    async def order_page(order_id: str):
+        return FastJSONResponse(PAGE)
+
+    @app.get("/orders/")
+    async def read_orders():
+        async with engine.connect() as conn:
+            rows = (await conn.execute(text('SELECT id, service, status FROM "order" LIMIT 50'))).all()
+        return FastJSONResponse([dict(row._mapping) for row in rows])
+
+    if instrumented:
+        app.add_middleware(RequestMetricsMiddleware)
+    return app
+
+
+async def call(app, path: str):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def time_requests(app, path: str, requests: int) -> float:
+    # Mean per-request time, in microseconds
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(app, path)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def compare_requests(path: str, requests: int, rounds: int, with_db: bool = False):
+    # Alternates the two apps so drift (CPU frequency, other load) hits
+    # both; the fastest round is the one least disturbed by noise
+    plain_engine = hooked_engine = None
+    if with_db:
+        plain_engine = create_async_engine(ASYNC_DATABASE_URL, pool_size=1)
+        hooked_engine = create_async_engine(ASYNC_DATABASE_URL, pool_size=1)
+        time_queries(hooked_engine.sync_engine, "bench")
+    plain_app, instrumented_app = build_app(False, plain_engine), build_app(True, hooked_engine)
+    await time_requests(plain_app, path, 500)
+    await time_requests(instrumented_app, path, 500)
+    plain, instrumented = [], []
+    for _ in range(rounds):
+        plain.append(await time_requests(plain_app, path, requests))
+        instrumented.append(await time_requests(instrumented_app, path, requests))
+    if with_db:
+        await plain_engine.dispose()
+        await hooked_engine.dispose()
+    return min(plain), min(instrumented)
+
+
+def time_select(conn, queries: int) -> float:
+    start = time.perf_counter()
+    for _ in range(queries):
+        conn.execute(text("SELECT 1"))
+    return (time.perf_counter() - start) / queries * 1e6
+
+
+def compare_queries(queries: int, rounds: int):
+    plain_engine = create_engine(DATABASE_URL, pool_size=1)
+    hooked_engine = create_engine(DATABASE_URL, pool_size=1)
+    time_queries(hooked_engine, "bench")
+    plain, instrumented = [], []
+    with plain_engine.connect() as plain_conn, hooked_engine.connect() as hooked_conn:
+        time_select(plain_conn, 200)
+        time_select(hooked_conn, 200)
+        for _ in range(rounds):
+            plain.append(time_select(plain_conn, queries))
+            instrumented.append(time_select(hooked_conn, queries))
+    plain_engine.dispose()
+    hooked_engine.dispose()
+    return min(plain), min(instrumented)
+
+
+def report(label: str, plain: float, instrumented: float):
+    overhead = instrumented - plain
+    print(f"{label:<22} {plain:10.1f} {instrumented:14.1f} {overhead:9.1f} {overhead / plain:9.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the overhead of request, query and stage metrics")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--no-db", action="store_true", help="skip the database round-trip measurement")
+    args = parser.parse_args()
+
+    print(f"{'':<22} {'plain us':>10} {'instrumented':>14} {'added us':>9} {'overhead':>9}")
+    for label, path in (("http /ping", "/ping"), ("http 50-order page", "/orders/ABC")):
+        report(label, *asyncio.run(compare_requests(path, args.requests, args.rounds)))
+    if not args.no_db:
+        report("db SELECT 1", *compare_queries(args.queries, args.rounds))
+        report("full 50-order query", *asyncio.run(compare_requests("/orders/", args.queries, args.rounds, with_db=True)))
+
+
+if __name__ == "__main__":
+    main()
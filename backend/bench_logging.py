@@ -0,0 +1,118 @@
+import argparse
+import io
+import logging
+import os
+import sys
+import time
+
+# Inference must run in this process for the legacy dump to be patched in
+os.environ["AI_WORKERS"] = "0"
+
+import numpy as np
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from . import ai_service
+from .log_config import RequestContextFilter, configure_logging
+from .main import app
+
+# /ai/analyze throughput with the old per-request dump of the raw model
+# output to stdout (what ai_service printed before structured logging)
+# against the logging pipeline at INFO, and at DEBUG with and without
+# sampling. Every request uploads a different photo so the result cache
+# never answers. Results go to stderr; run with stdout attached to what
+# production writes to (a pipe, a terminal, a log shipper):
+#
+#   python -m backend.bench_logging --requests 200 --rounds 3 | cat > /dev/null
+
+
+def make_uploads(count: int, seed: int, size=(1280, 960)):
+    rng = np.random.default_rng(seed)
+    uploads = []
+    for _ in range(count):
+        pixels = rng.integers(0, 256, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+        image = Image.fromarray(pixels).resize(size, Image.NEAREST)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        uploads.append(buffer.getvalue())
+    return uploads
+
+
+def install_legacy_dump():
+    """
+    Prints the backend's raw output for every inference, as the old code
+    did with ultralytics' Results list. Returns a function that undoes it.
+    """
+    backend = ai_service.get_backend()
+    if hasattr(backend, "model"):
+        target, name = backend.model, "predict"
+    else:
+        target, name = backend.session, "run"
+    original = getattr(target, name)
+
+    def dumping(*args, **kwargs):
+        results = original(*args, **kwargs)
+        print(f"AI Debug: Raw Results for upload: {results}")
+        return results
+
+    setattr(target, name, dumping)
+    return lambda: setattr(target, name, original)
+
+
+def set_logging(level: int, sample: float):
+    logging.getLogger("backend").setLevel(level)
+    for handler in logging.getLogger().handlers:
+        for log_filter in handler.filters:
+            if isinstance(log_filter, RequestContextFilter):
+                log_filter.debug_sample = sample
+
+
+def run(client: TestClient, uploads) -> float:
+    start = time.perf_counter()
+    for i, contents in enumerate(uploads):
+        response = client.post("/ai/analyze", files={"file": (f"{i}.jpg", contents, "image/jpeg")})
+        response.raise_for_status()
+    return len(uploads) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /ai/analyze with print dumps vs queued logging")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    configure_logging()
+    modes = [
+        ("print raw results", logging.WARNING, 0.0, True),
+        ("logging INFO", logging.INFO, 0.0, False),
+        ("logging DEBUG 1%", logging.DEBUG, 0.01, False),
+        ("logging DEBUG all", logging.DEBUG, 1.0, False),
+    ]
+    with TestClient(app) as client:
+        ai_service.warm_up()
+        run(client, make_uploads(10, seed=0))
+        best = {label: 0.0 for label, *_ in modes}
+        # Modes take turns each round so drift affects them all; each keeps
+        # its best round
+        for round_index in range(args.rounds):
+            for i, (label, level, sample, legacy) in enumerate(modes):
+                # Fresh photos every time, so nothing is answered from the cache
+                uploads = make_uploads(args.requests, seed=1 + round_index * len(modes) + i)
+                set_logging(level, sample)
+                undo = install_legacy_dump() if legacy else None
+                try:
+                    best[label] = max(best[label], run(client, uploads))
+                finally:
+                    if undo:
+                        undo()
+        set_logging(logging.INFO, 0.0)
+    results = list(best.items())
+
+    baseline = results[0][1]
+    print(f"{'mode':<20} {'req/s':>8} {'vs print':>9}", file=sys.stderr)
+    for label, throughput in results:
+        print(f"{label:<20} {throughput:8.1f} {throughput / baseline - 1:+9.1%}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
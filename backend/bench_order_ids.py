@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import random
+import string
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, event
+
+from .database import async_engine, async_session_factory
+from .models import Order
+from .order_ids import ORDER_ID_BLOCK_SIZE
+
+# Insert throughput with many concurrent writers, comparing the hi-lo
+# sequence IDs with the old scheme (2 random letters + 4 digits, checked
+# for existence first and retried on a primary-key clash). Rows are
+# tagged and deleted afterwards.
+#
+#   python -m backend.bench_order_ids --writers 32 --orders 2000
+
+BENCH_ADDRESS = "bench_order_ids"
+
+
+def legacy_order_id() -> str:
+    letters = "".join(random.choices(string.ascii_uppercase, k=2))
+    numbers = "".join(random.choices(string.digits, k=4))
+    return f"{letters}{numbers}"
+
+
+def new_order(order_id=None) -> Order:
+    return Order(
+        id=order_id,
+        service="Wash & Fold",
+        pickup_date=datetime.utcnow(),
+        time_slot="8:00 AM - 10:00 AM",
+        address=BENCH_ADDRESS,
+    )
+
+
+async def insert_sequence_backed():
+    async with async_session_factory() as session:
+        session.add(new_order())
+        await session.commit()
+
+
+async def insert_legacy(stats):
+    while True:
+        order_id = legacy_order_id()
+        async with async_session_factory() as session:
+            # The pre-check the old scheme needs to stay safe
+            if await session.get(Order, order_id) is not None:
+                stats["collisions"] += 1
+                continue
+            session.add(new_order(order_id))
+            try:
+                await session.commit()
+                return
+            except Exception:
+                stats["collisions"] += 1
+
+
+async def run(label, insert, orders, writers):
+    remaining = orders
+    latencies = []
+
+    async def writer():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await insert()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(writers)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(
+        f"{label:<16} {orders / elapsed:9.0f} inserts/s   "
+        f"p50 {latencies[len(latencies) // 2] * 1000:6.2f} ms   "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark order ID generation under concurrent inserts")
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--orders", type=int, default=2000)
+    args = parser.parse_args()
+
+    statements = {"nextval": 0}
+
+    def count_nextval(conn, cursor, statement, parameters, context, executemany):
+        if "nextval" in statement:
+            statements["nextval"] += 1
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_nextval)
+    stats = {"collisions": 0}
+    try:
+        await run("legacy random", lambda: insert_legacy(stats), args.orders, args.writers)
+        await run("hi-lo sequence", insert_sequence_backed, args.orders, args.writers)
+    finally:
+        async with async_session_factory() as session:
+            await session.exec(delete(Order).where(Order.address == BENCH_ADDRESS))
+            await session.commit()
+        await async_engine.dispose()
+
+    print(f"\nlegacy collisions retried: {stats['collisions']}")
+    print(f"sequence round-trips: {statements['nextval']} for {args.orders} orders (block size {ORDER_ID_BLOCK_SIZE})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# Peak memory and decode time for a phone-sized upload, decoded the old way
+# (full-resolution cv2.imdecode, then resize) versus ai_service.decode_image
+# (JPEG draft mode straight to the model input size). Each mode runs in a
+# fresh interpreter so ru_maxrss reflects that mode alone.
+#
+#   python -m backend.bench_preprocess --width 4032 --height 3024
+
+MODES = ("full", "draft")
+
+
+def make_photo(width: int, height: int) -> bytes:
+    # Noise compresses like a real photo, unlike a flat colour
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes()
+
+
+def decode_full(image_bytes: bytes, size: int) -> np.ndarray:
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    scale = size / max(image.shape[:2])
+    return cv2.resize(image, (round(image.shape[1] * scale), round(image.shape[0] * scale)))
+
+
+def measure(mode: str, image_bytes: bytes, size: int, rounds: int) -> dict:
+    from .ai_service import decode_image
+
+    decode = decode_image if mode == "draft" else decode_full
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        decode(image_bytes, size)
+        samples.append((time.perf_counter() - start) * 1000)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    samples.sort()
+    return {
+        "mode": mode,
+        "p50_ms": samples[len(samples) // 2],
+        "max_ms": samples[-1],
+        "peak_rss_delta_mb": (peak_kb - baseline_kb) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-resolution and draft-mode upload decoding")
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--size", type=int, default=320, help="model input size (AI_INPUT_SIZE)")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        # Child process: decode and report one mode
+        image_bytes = sys.stdin.buffer.read()
+        # Touch the decoders once so their own allocations are in the baseline
+        warm = make_photo(64, 64)
+        decode_full(warm, 32)
+        from .ai_service import decode_image
+        decode_image(warm, 32)
+        print(json.dumps(measure(args.mode, image_bytes, args.size, args.rounds)))
+        return
+
+    photo = make_photo(args.width, args.height)
+    print(f"Synthetic {args.width}x{args.height} JPEG, {len(photo) / 1e6:.1f} MB, decoded to {args.size}px")
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, "-m", "backend.bench_preprocess", "--mode", mode,
+             "--size", str(args.size), "--rounds", str(args.rounds)],
+            input=photo,
+            capture_output=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        print(
+            f"{mode:<6} p50={result['p50_ms']:7.1f}ms max={result['max_ms']:7.1f}ms "
+            f"peak RSS +{result['peak_rss_delta_mb']:6.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import gzip
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from .models import Order, OrderRead
+from .orders import ORDER_READ_FIELDS
+from .responses import GZIP_LEVEL, FastJSONResponse, add_compression
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Serialization cost of the order list endpoints, without the database:
+# the old path (ORM objects validated against response_model=List[OrderRead]
+# and encoded by FastAPI) against the new one (tuple rows encoded by
+# FastJSONResponse), through a real FastAPI app, plus bytes on the wire for
+# identity, gzip and (if installed) brotli.
+#
+#   python -m backend.bench_serialization --sizes 10000 100000
+
+
+def make_rows(count: int) -> List[tuple]:
+    start = datetime(2025, 1, 1)
+    services = ["Wash & Fold", "Dry Cleaning", "Special Care"]
+    statuses = ["Pending", "Picked Up", "Processing", "Delivered"]
+    rows = []
+    for i in range(count):
+        values = {
+            "service": random.choice(services),
+            "pickup_date": start + timedelta(hours=i),
+            "time_slot": "8:00 AM - 10:00 AM",
+            "address": f"{i} Laundry Lane, Springfield",
+            "notes": None if i % 3 else "Leave at the door",
+            "amount": round(random.uniform(10, 120), 2),
+            "items_count": random.randint(1, 30),
+            "status": random.choice(statuses),
+            "id": f"{i:08d}",
+            "created_at": start + timedelta(minutes=i),
+            "user_id": i % 500,
+        }
+        rows.append(tuple(values[field] for field in ORDER_READ_FIELDS))
+    return rows
+
+
+def build_app(rows: List[tuple]) -> FastAPI:
+    orm_objects = [Order(**dict(zip(ORDER_READ_FIELDS, row))) for row in rows]
+    app = FastAPI()
+    add_compression(app)
+
+    @app.get("/orm", response_model=List[OrderRead])
+    def orm_path():
+        return orm_objects
+
+    @app.get("/fast", response_model=List[OrderRead])
+    def fast_path():
+        return FastJSONResponse([dict(zip(ORDER_READ_FIELDS, row)) for row in rows])
+
+    return app
+
+
+def timed(client: TestClient, path: str, rounds: int):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        response = client.get(path, headers={"Accept-Encoding": "identity"})
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, response.content
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark order list serialization")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'orders':>8} {'path':<6} {'median ms':>10} {'identity KB':>12} {'gzip KB':>9} {'brotli KB':>10}")
+    for size in args.sizes:
+        client = TestClient(build_app(make_rows(size)))
+        results = {}
+        for path in ("orm", "fast"):
+            ms, body = timed(client, f"/{path}", args.rounds)
+            results[path] = body
+            gzipped = len(gzip.compress(body, compresslevel=GZIP_LEVEL))
+            brotli_kb = f"{len(brotli.compress(body, quality=4)) / 1024:10.0f}" if brotli else f"{'n/a':>10}"
+            print(f"{size:8d} {path:<6} {ms:10.1f} {len(body) / 1024:12.0f} {gzipped / 1024:9.0f} {brotli_kb}")
+        if client.get("/orm").json() != client.get("/fast").json():
+            raise SystemExit("FAILURE: the two paths produced different JSON")
+        # What the middleware actually sends when the client accepts gzip
+        wire = client.get("/fast", headers={"Accept-Encoding": "gzip"})
+        print(f"{'':8} served with Content-Encoding: {wire.headers.get('content-encoding')}")
+
+
+if __name__ == "__main__":
+    main()
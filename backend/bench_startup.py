@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Measures cold-start costs in fresh interpreters so they can be tracked
+# across releases:
+#   import_seconds           - `import backend.main` (should stay model-free)
+#   model_load_seconds       - loading the weights through ai_service
+#   first_inference_seconds  - the warm-up predict on a synthetic image
+#
+#   python -m backend.bench_startup --runs 3 --output startup_history.jsonl
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+IMPORT_SNIPPET = """
+import json, time
+start = time.perf_counter()
+import backend.main
+print(json.dumps({"import_seconds": time.perf_counter() - start}))
+"""
+
+MODEL_SNIPPET = """
+import json
+from backend.ai_service import warm_up
+print(json.dumps(warm_up()))
+"""
+
+
+def run_snippet(snippet: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", snippet],
+        cwd=REPO_ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    # The JSON line is the last thing printed; anything before is load chatter
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API import, model load and first-inference time")
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per measurement; the median is kept")
+    parser.add_argument("--skip-model", action="store_true", help="only measure the app import")
+    parser.add_argument("--output", help="append the result as one JSON line to this file")
+    args = parser.parse_args()
+
+    samples = {}
+    for _ in range(args.runs):
+        timings = run_snippet(IMPORT_SNIPPET)
+        if not args.skip_model:
+            timings.update(run_snippet(MODEL_SNIPPET))
+        for name, value in timings.items():
+            samples.setdefault(name, []).append(value)
+
+    record = {"timestamp": int(time.time()), "revision": git_revision(), "runs": args.runs}
+    for name, values in samples.items():
+        record[name] = round(sorted(values)[len(values) // 2], 4)
+
+    for name, value in record.items():
+        print(f"{name:<24} {value}")
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
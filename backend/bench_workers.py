@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+import uuid
+from typing import Dict, List
+
+import httpx
+
+from .bench_api import IMAGE_GLOB, REPO_ROOT, free_port, percentile, wait_until_ready
+
+# Memory and /ai/analyze throughput of the pre-fork server (gunicorn_conf.py)
+# per worker count, with the model loaded once in the master (preload) and
+# with every worker loading its own. Memory is read from /proc after the
+# load, once every worker has run inference:
+#   PSS  - proportional set size, shared pages split between the processes
+#          sharing them; the sum over master and workers is the real total
+#   USS  - pages private to a process, what one more worker costs
+# so "per extra worker" is the growth in total PSS per worker added.
+# Linux only. Needs the database, like any run of the app.
+#
+#   python -m backend.bench_workers --workers 1 2 4 --duration 30 --json workers.json
+
+CONFIG = os.path.join(os.path.dirname(__file__), "gunicorn_conf.py")
+
+
+def start_server(port: int, workers: int, preload: bool, threads: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "BIND": f"127.0.0.1:{port}",
+        "WEB_CONCURRENCY": str(workers),
+        "PRELOAD_APP": "true" if preload else "false",
+        "AI_THREADS_PER_WORKER": str(threads),
+        # No recycling mid-measurement
+        "MAX_REQUESTS": "0",
+        "LOG_LEVEL": "WARNING",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", CONFIG, "backend.main:app"],
+        cwd=REPO_ROOT,
+        env=env,
+        start_new_session=True,
+    )
+
+
+def process_tree(pid: int) -> List[int]:
+    pids = [pid]
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            for child in f.read().split():
+                pids.extend(process_tree(int(child)))
+    return pids
+
+
+def memory_mb(pid: int) -> Dict[str, float]:
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                fields[name] = int(value.split()[0]) / 1024
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "uss": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+async def wait_for_workers(client: httpx.AsyncClient, workers: int, timeout: float):
+    # /readyz is answered by whichever worker accepts; keep asking until a
+    # long run of answers is all ready, so every worker has warmed up
+    deadline = time.perf_counter() + timeout
+    streak = 0
+    while streak < workers * 10:
+        if time.perf_counter() > deadline:
+            raise SystemExit(f"Workers not ready after {timeout:.0f}s")
+        response = await client.get("/readyz")
+        streak = streak + 1 if response.status_code == 200 else 0
+        if not streak:
+            await asyncio.sleep(0.2)
+
+
+async def load(client: httpx.AsyncClient, images: List[bytes], concurrency: int, duration: float) -> dict:
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def user(rng: random.Random):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            # A unique tail per upload, so the result cache never answers
+            contents = rng.choice(images) + uuid.uuid4().bytes
+            start = time.perf_counter()
+            try:
+                response = await client.post("/ai/analyze", files={"file": ("photo.jpg", contents, "image/jpeg")})
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(random.Random(i)) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 0.95) * 1000 if latencies else None,
+    }
+
+
+async def measure(workers: int, preload: bool, args, images: List[bytes]) -> dict:
+    port = free_port()
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+    server = start_server(port, workers, preload, threads)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency * workers)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+            await wait_until_ready(client, server, args.startup_timeout)
+            await wait_for_workers(client, workers, args.startup_timeout)
+            await load(client, images, args.concurrency * workers, args.warmup)
+            result = await load(client, images, args.concurrency * workers, args.duration)
+        pids = process_tree(server.pid)
+        per_process = [memory_mb(pid) for pid in pids]
+        worker_memory = per_process[1:]
+        return {
+            "workers": workers,
+            "preload": preload,
+            "threads_per_worker": threads,
+            **result,
+            "master_pss_mb": per_process[0]["pss"],
+            "total_pss_mb": sum(entry["pss"] for entry in per_process),
+            "worker_uss_mb": sum(entry["uss"] for entry in worker_memory) / len(worker_memory),
+            "worker_rss_mb": sum(entry["rss"] for entry in worker_memory) / len(worker_memory),
+        }
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def print_report(rows: List[dict]):
+    print(f"\n{'workers':>7} {'preload':>7} {'thr':>3} {'req/s':>7} {'scaling':>7} {'p95 ms':>7} "
+          f"{'total PSS':>9} {'per extra':>9} {'worker USS':>10} {'worker RSS':>10}")
+    for row in rows:
+        same_mode = [other for other in rows if other["preload"] == row["preload"]]
+        single = min(same_mode, key=lambda other: other["workers"])
+        scaling = row["throughput"] / single["throughput"] if single["throughput"] else 0.0
+        if row["workers"] > single["workers"]:
+            per_extra = (row["total_pss_mb"] - single["total_pss_mb"]) / (row["workers"] - single["workers"])
+            row["pss_per_extra_worker_mb"] = per_extra
+            per_extra = f"{per_extra:9.0f}"
+        else:
+            per_extra = f"{'-':>9}"
+        p95 = f"{row['p95_ms']:7.0f}" if row["p95_ms"] is not None else f"{'-':>7}"
+        print(f"{row['workers']:7d} {'yes' if row['preload'] else 'no':>7} {row['threads_per_worker']:3d} "
+              f"{row['throughput']:7.1f} {scaling:6.2f}x {p95} {row['total_pss_mb']:9.0f} {per_extra} "
+              f"{row['worker_uss_mb']:10.0f} {row['worker_rss_mb']:10.0f}")
+    print("\nMemory in MB. 'per extra' is the growth in total PSS for each worker beyond the smallest count.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and throughput of the pre-fork server per worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--no-compare", action="store_true", help="only measure with the model preloaded")
+    parser.add_argument("--threads", type=int, help="AI_THREADS_PER_WORKER (default: cores / workers)")
+    parser.add_argument("--concurrency", type=int, default=4, help="clients per worker")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        raise SystemExit("Needs Linux (/proc/<pid>/smaps_rollup)")
+    paths = sorted(glob.glob(IMAGE_GLOB, recursive=True))[:50]
+    if not paths:
+        raise SystemExit(f"No images match {IMAGE_GLOB}")
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+
+    rows = []
+    for preload in ([True] if args.no_compare else [True, False]):
+        for workers in args.workers:
+            print(f"{workers} worker(s), preload {'on' if preload else 'off'}...", file=sys.stderr)
+            rows.append(asyncio.run(measure(workers, preload, args, images)))
+    print_report(rows)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cpus": os.cpu_count(), "duration": args.duration, "runs": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
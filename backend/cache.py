@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from .metrics import Counter
+
+CACHE_HITS = Counter("cache_hits_total", "Cache lookups served from the cache", ["cache", "tier"])
+CACHE_MISSES = Counter("cache_misses_total", "Cache lookups that found nothing", ["cache"])
+CACHE_EVICTIONS = Counter("cache_evictions_total", "Entries dropped for size or age", ["cache"])
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire `ttl` seconds after
+    they were stored. Hit/miss/eviction counts are exported under `name`.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str = "default"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, record: bool = True):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    if record:
+                        CACHE_HITS.inc(cache=self.name, tier="memory")
+                    return value
+                del self._data[key]
+                CACHE_EVICTIONS.inc(cache=self.name)
+        if record:
+            CACHE_MISSES.inc(cache=self.name)
+        return default
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                CACHE_EVICTIONS.inc(cache=self.name)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache:
+    """
+    JSON-per-entry cache in a directory, shared by every process that points
+    at it and kept across restarts. Writes go through a temp file and
+    os.replace so readers never see a partial entry.
+
+    Writes also sweep the directory now and then (every `sweep_seconds`, or
+    sooner after a tenth of `max_entries` writes): expired files go, and
+    beyond `max_entries` (0 for no cap) the least recently written ones
+    too, down to 90% of the cap. Processes sweep independently; one finding
+    a file already gone just moves on.
+    """
+
+    def __init__(self, directory: str, ttl: float, max_entries: int = 0, sweep_seconds: float = 60.0, name: str = "default"):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max(0, max_entries)
+        self.sweep_seconds = sweep_seconds
+        self.name = name
+        self._sweep_lock = threading.Lock()
+        self._writes = 0
+        self._next_sweep = time.monotonic() + sweep_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                CACHE_EVICTIONS.inc(cache=self.name)
+                return None
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(value, f)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._writes += 1
+        if time.monotonic() >= self._next_sweep or (self.max_entries and self._writes * 10 >= self.max_entries):
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Removes expired entries, then the oldest beyond max_entries. Returns how many went."""
+        if not self._sweep_lock.acquire(blocking=False):
+            return 0  # another thread is already at it
+        try:
+            self._writes = 0
+            self._next_sweep = time.monotonic() + self.sweep_seconds
+            now = time.time()
+            entries, expired = [], []
+            for shard in os.scandir(self.directory):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    try:
+                        mtime = entry.stat().st_mtime
+                    except OSError:
+                        continue
+                    # Includes temp files left behind by a crashed writer
+                    if now - mtime > self.ttl:
+                        expired.append(entry.path)
+                    elif entry.name.endswith(".json"):
+                        entries.append((mtime, entry.path))
+            if self.max_entries and len(entries) > self.max_entries:
+                entries.sort()
+                expired.extend(path for _, path in entries[: len(entries) - int(self.max_entries * 0.9)])
+            removed = 0
+            for path in expired:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+            CACHE_EVICTIONS.inc(removed, cache=self.name)
+            return removed
+        finally:
+            self._sweep_lock.release()
+
+
+class ResultCache:
+    """
+    Two-tier cache for analysis results keyed by the image content plus
+    everything that can change the answer (model version, threshold).
+    The in-process tier is checked first; the optional disk tier is read
+    off the event loop and promotes hits back into memory.
+    """
+
+    def __init__(self, memory: TTLCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    @staticmethod
+    def key_for(image_bytes: bytes, model_version: str, confidence: float) -> str:
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return hashlib.sha256(f"{digest}:{model_version}:{confidence}".encode()).hexdigest()
+
+    async def get(self, key: str):
+        value = self.memory.get(key, record=False)
+        if value is not None:
+            CACHE_HITS.inc(cache=self.memory.name, tier="memory")
+            return value
+        if self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                CACHE_HITS.inc(cache=self.memory.name, tier="disk")
+                self.memory.set(key, value)
+                return value
+        CACHE_MISSES.inc(cache=self.memory.name)
+        return None
+
+    async def set(self, key: str, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
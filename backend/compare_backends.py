@@ -0,0 +1,116 @@
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+import cv2
+
+from .ai_service import recommendation_for
+from .inference_backends import load_backend
+from .model_config import CONFIDENCE_THRESHOLD, served_model_path
+
+# Accuracy-vs-latency report for the inference backends. Every backend runs
+# over the same images; the torch backend is the reference, and each other
+# backend must give the same label and recommendation (and a confidence
+# within --conf-tolerance) on at least --min-agreement of the images.
+#
+#   python -m backend.compare_backends
+#   python -m backend.compare_backends --backends torch onnx-int8 --json report.json
+
+IMAGE_DIR = os.path.join(os.path.dirname(__file__), "..", "laundry_data", "images", "val")
+
+
+def run_backend(kind, images, rounds):
+    backend = load_backend(kind, served_model_path(kind))
+    backend.detect([images[0]], CONFIDENCE_THRESHOLD)  # warm-up
+    latencies = []
+    detections = []
+    for round_index in range(rounds):
+        for image in images:
+            start = time.perf_counter()
+            detection = backend.detect([image], CONFIDENCE_THRESHOLD)[0]
+            latencies.append((time.perf_counter() - start) * 1000)
+            if round_index == 0:
+                detections.append(detection)
+    return detections, latencies
+
+
+def compare(reference, candidate, conf_tolerance):
+    same_label = same_recommendation = within_conf = 0
+    for ref, cand in zip(reference, candidate):
+        ref_label = ref[0] if ref else "Normal"
+        cand_label = cand[0] if cand else "Normal"
+        same_label += ref_label == cand_label
+        same_recommendation += recommendation_for(ref_label) == recommendation_for(cand_label)
+        ref_conf = ref[1] if ref else 0.0
+        cand_conf = cand[1] if cand else 0.0
+        within_conf += ref_label == cand_label and abs(ref_conf - cand_conf) <= conf_tolerance
+    total = len(reference)
+    return {
+        "label_agreement": same_label / total,
+        "recommendation_agreement": same_recommendation / total,
+        "confidence_within_tolerance": within_conf / total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference backends for accuracy and latency")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--image-dir", default=IMAGE_DIR)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--conf-tolerance", type=float, default=0.05)
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.image_dir, "*.jpg")))
+    if not paths:
+        raise SystemExit(f"No images found in {args.image_dir}")
+    images = [cv2.imread(path, cv2.IMREAD_COLOR) for path in paths]
+
+    backends = [kind for kind in args.backends if kind == "torch" or os.path.exists(served_model_path(kind))]
+    for kind in set(args.backends) - set(backends):
+        print(f"Skipping {kind}: {served_model_path(kind)} not found (run backend.export_model)")
+    if "torch" not in backends:
+        raise SystemExit("The torch backend is the reference and must be included")
+
+    results = {kind: run_backend(kind, images, args.rounds) for kind in backends}
+    reference = results["torch"][0]
+
+    report = {"images": len(images), "rounds": args.rounds, "backends": {}}
+    print(f"{'backend':<10} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'speedup':>8} {'label':>7} {'recommend':>10} {'conf':>6}")
+    torch_mean = statistics.mean(results["torch"][1])
+    failed = False
+    for kind in backends:
+        detections, latencies = results[kind]
+        ordered = sorted(latencies)
+        entry = {
+            "mean_ms": statistics.mean(latencies),
+            "p50_ms": ordered[len(ordered) // 2],
+            "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            **compare(reference, detections, args.conf_tolerance),
+        }
+        entry["speedup"] = torch_mean / entry["mean_ms"]
+        report["backends"][kind] = entry
+        print(
+            f"{kind:<10} {entry['mean_ms']:8.2f} {entry['p50_ms']:8.2f} {entry['p95_ms']:8.2f} "
+            f"{entry['speedup']:7.2f}x {entry['label_agreement']:7.0%} "
+            f"{entry['recommendation_agreement']:10.0%} {entry['confidence_within_tolerance']:6.0%}"
+        )
+        if entry["recommendation_agreement"] < args.min_agreement:
+            failed = True
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if failed:
+        print(f"\nFAILURE: a backend's recommendations agree with torch on less than {args.min_agreement:.0%} of images")
+        sys.exit(1)
+    print("\nSUCCESS: all backends within tolerance")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,10 @@
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from pydantic import EmailStr
-from pathlib import Path
-from dotenv import load_dotenv
-import os
+from typing import List
+from .notifications import notifier
 
-load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+# Message templates. Sending is handled by the notifier: these only queue
+# the mail, so they are cheap to call straight from a request handler.
 
-print(f"DEBUG: Loading env from {os.path.join(os.path.dirname(__file__), '.env')}")
-print(f"DEBUG: Is file there? {os.path.exists(os.path.join(os.path.dirname(__file__), '.env'))}")
-print(f"DEBUG: MAIL_FROM={os.getenv('MAIL_FROM')}")
-
-conf = ConnectionConfig(
-    MAIL_USERNAME=os.getenv("MAIL_USERNAME"),
-    MAIL_PASSWORD=os.getenv("MAIL_PASSWORD"),
-    MAIL_FROM=os.getenv("MAIL_FROM"),
-    MAIL_PORT=int(os.getenv("MAIL_PORT", 587)),
-    MAIL_SERVER=os.getenv("MAIL_SERVER", "smtp.gmail.com"),
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True
-)
-
-async def send_order_confirmation(email: EmailStr, order_id: str, pickup_date: str):
+def send_order_confirmation(email: str, order_id: str, pickup_date: str) -> bool:
     html = f"""
     <h3>Order Confirmed!</h3>
     <p>Thank you for choosing FreshAI Laundry.</p>
@@ -30,22 +12,9 @@ async def send_order_confirmation(email: EmailStr, order_id: str, pickup_date: s
     <br>
     <p>You can track your order status on your dashboard.</p>
     """
-    
-    message = MessageSchema(
-        subject=f"Order Confirmation #{order_id}",
-        recipients=[email],
-        body=html,
-        subtype=MessageType.html
-    )
+    return notifier.enqueue(email, f"Order Confirmation #{order_id}", html)
 
-    fm = FastMail(conf)
-    try:
-        await fm.send_message(message)
-        print(f"DEBUG_EMAIL: Successfully sent order confirmation to {email}")
-    except Exception as e:
-        print(f"DEBUG_EMAIL: Failed to send order confirmation to {email}. Error: {e}")
-
-async def send_status_update(email: EmailStr, order_id: str, new_status: str):
+def send_status_update(email: str, order_id: str, new_status: str) -> bool:
     html = f"""
     <h3>Order Update</h3>
     <p>The status of your order <b>#{order_id}</b> has been updated.</p>
@@ -53,17 +22,18 @@ async def send_status_update(email: EmailStr, order_id: str, new_status: str):
     <br>
     <p>Thank you for using FreshAI Laundry.</p>
     """
-    
-    message = MessageSchema(
-        subject=f"Order Update #{order_id} - {new_status}",
-        recipients=[email],
-        body=html,
-        subtype=MessageType.html
-    )
+    return notifier.enqueue(email, f"Order Update #{order_id} - {new_status}", html)
 
-    fm = FastMail(conf)
-    try:
-        await fm.send_message(message)
-        print(f"DEBUG_EMAIL: Successfully sent status update to {email}")
-    except Exception as e:
-        print(f"DEBUG_EMAIL: Failed to send status update to {email}. Error: {e}")
+def send_status_digest(email: str, order_ids: List[str], new_status: str) -> bool:
+    # One mail for all of a customer's orders moved in a bulk update
+    if len(order_ids) == 1:
+        return send_status_update(email, order_ids[0], new_status)
+    items = "".join(f"<li><b>#{order_id}</b></li>" for order_id in order_ids)
+    html = f"""
+    <h3>Order Update</h3>
+    <p>The status of {len(order_ids)} of your orders has been updated to <b>{new_status}</b>:</p>
+    <ul>{items}</ul>
+    <br>
+    <p>Thank you for using FreshAI Laundry.</p>
+    """
+    return notifier.enqueue(email, f"{len(order_ids)} orders updated - {new_status}", html)
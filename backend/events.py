@@ -0,0 +1,352 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import signal
+import threading
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from .database import DATABASE_URL
+from .metrics import Counter, Gauge
+from .responses import dumps
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+logger = logging.getLogger(__name__)
+
+# Order events pushed to browsers instead of polling. Handlers publish after
+# committing; each subscriber (one per open Server-Sent Events stream) sees
+# either its own customer's events or, for staff, everything. Recent events
+# stay in a bounded buffer so a client that reconnects with Last-Event-ID
+# gets what it missed.
+#
+# EVENTS_BROKER=memory (default) fans out within one process only; the
+# gunicorn config, which runs several workers, defaults to postgres.
+# EVENTS_BROKER=postgres relays every event through LISTEN/NOTIFY so all API
+# processes and replicas deliver it; since NOTIFY reaches every listener in
+# commit order, each process's buffer holds the same sequence and
+# Last-Event-ID replay works whichever replica the client reconnects to.
+#
+# Publishing is best effort: handlers publish after their write has
+# committed, so a broker failure is logged rather than failing the request.
+
+EVENTS_BROKER = os.getenv("EVENTS_BROKER", "memory")
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", 1000))
+EVENTS_SUBSCRIBER_QUEUE = int(os.getenv("EVENTS_SUBSCRIBER_QUEUE", 100))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", 15))
+# Streams end after this long and the browser reconnects with Last-Event-ID,
+# so no connection outlives a deploy by more than this
+EVENTS_MAX_STREAM_SECONDS = float(os.getenv("EVENTS_MAX_STREAM_SECONDS", 900))
+EVENTS_CHANNEL = "order_events"
+
+SUBSCRIBERS = Gauge("events_subscribers", "Open event streams")
+PUBLISHED = Counter("events_published_total", "Events delivered to this process's subscribers", ["type"])
+DROPPED = Counter("events_dropped_subscribers_total", "Streams closed because the client could not keep up")
+PUBLISH_FAILED = Counter("events_publish_failed_total", "Events that could not be handed to the broker")
+RECONNECTS = Counter("events_listener_reconnects_total", "LISTEN connections reopened after being lost")
+
+
+class Event:
+    __slots__ = ("id", "type", "user_id", "data")
+
+    def __init__(self, type: str, user_id: Optional[int], data: dict, id: Optional[str] = None):
+        # Unique across processes; ordering comes from the buffer, not the id
+        self.id = id or f"{time.time_ns():x}-{uuid.uuid4().hex[:8]}"
+        self.type = type
+        self.user_id = user_id
+        self.data = data
+
+    def to_json(self) -> str:
+        return dumps({"id": self.id, "type": self.type, "user_id": self.user_id, "data": self.data}).decode()
+
+    @classmethod
+    def from_json(cls, payload: str) -> "Event":
+        raw = json.loads(payload)
+        return cls(raw["type"], raw["user_id"], raw["data"], id=raw["id"])
+
+    def format_sse(self) -> str:
+        return f"id: {self.id}\nevent: {self.type}\ndata: {dumps(self.data).decode()}\n\n"
+
+
+# Ends a subscription; also sent when the client fell too far behind
+_CLOSED = object()
+
+
+class Subscription:
+    def __init__(self, broker: "InProcessBroker", user_id: Optional[int]):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=EVENTS_SUBSCRIBER_QUEUE)
+
+    def wants(self, event: Event) -> bool:
+        return self.user_id is None or event.user_id == self.user_id
+
+    def offer(self, item) -> bool:
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def get(self, timeout: float):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self, buffer_size: int = EVENTS_BUFFER_SIZE):
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._subscribers: set = set()
+        self._handlers: Dict[str, Callable[[Event], None]] = {}
+
+    def handle(self, type: str, callback: Callable[[Event], None]):
+        """
+        Routes events of `type` to `callback` in every process instead of to
+        streams: for process-local state, such as caches, that other
+        processes' writes make stale.
+        """
+        self._handlers[type] = callback
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        self.close_subscriptions()
+
+    def close_subscriptions(self):
+        for subscription in list(self._subscribers):
+            subscription.offer(_CLOSED)
+            self._unsubscribe(subscription)
+
+    async def publish(self, event: Event):
+        await self.publish_many([event])
+
+    async def publish_many(self, events: List[Event]):
+        for event in events:
+            self._deliver(event)
+
+    def _deliver(self, event: Event):
+        handler = self._handlers.get(event.type)
+        if handler is not None:
+            handler(event)
+            return
+        self._buffer.append(event)
+        PUBLISHED.inc(type=event.type)
+        for subscription in list(self._subscribers):
+            if not subscription.wants(event):
+                continue
+            if not subscription.offer(event):
+                # A stuck client must not hold events in memory without
+                # bound; it reconnects and replays from the buffer
+                DROPPED.inc()
+                self._unsubscribe(subscription)
+                subscription.queue.get_nowait()
+                subscription.offer(_CLOSED)
+
+    def subscribe(self, user_id: Optional[int], last_event_id: Optional[str] = None):
+        """
+        Subscribes to one customer's events (or all, for user_id=None).
+        Returns (subscription, missed): `missed` holds buffered events after
+        `last_event_id`, or is None when that id has already left the
+        buffer and the client should reload its data instead.
+        """
+        subscription = Subscription(self, user_id)
+        missed = []
+        if last_event_id:
+            ids = [event.id for event in self._buffer]
+            if last_event_id in ids:
+                position = ids.index(last_event_id)
+                missed = [event for event in itertools.islice(self._buffer, position + 1, None) if subscription.wants(event)]
+            else:
+                missed = None
+        self._subscribers.add(subscription)
+        SUBSCRIBERS.set(len(self._subscribers))
+        return subscription, missed
+
+    def _unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+        SUBSCRIBERS.set(len(self._subscribers))
+
+
+class PostgresNotifyBroker(InProcessBroker):
+    """
+    Publishes with pg_notify and delivers what arrives on LISTEN, so every
+    process sees every event, including its own, in the same order.
+
+    The LISTEN connection is reopened, with backoff, whenever it is lost
+    (database restart, failover, idle timeout). Events sent meanwhile never
+    reach this process, so once it is back the buffer is emptied and open
+    streams are closed: clients reconnect, find their Last-Event-ID gone
+    and reload.
+    """
+
+    def __init__(self, dsn: str = DATABASE_URL, channel: str = EVENTS_CHANNEL, buffer_size: int = EVENTS_BUFFER_SIZE):
+        super().__init__(buffer_size)
+        self.dsn = dsn
+        self.channel = channel
+        self._connection = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # asyncpg runs one query at a time per connection
+        self._publish_lock = asyncio.Lock()
+
+    async def start(self):
+        self._stopping = False
+        # A dedicated connection: LISTEN needs one that stays open
+        await self._connect()
+
+    async def stop(self):
+        self._stopping = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            await asyncio.gather(self._reconnect_task, return_exceptions=True)
+            self._reconnect_task = None
+        await super().stop()
+        connection, self._connection = self._connection, None
+        if connection is not None and not connection.is_closed():
+            await connection.close()
+
+    async def _connect(self):
+        import asyncpg
+
+        connection = await asyncpg.connect(self.dsn)
+        await connection.add_listener(self.channel, self._on_notify)
+        connection.add_termination_listener(self._on_terminated)
+        self._connection = connection
+
+    def _on_terminated(self, connection):
+        if self._stopping or connection is not self._connection:
+            return
+        logger.warning("Lost the %s LISTEN connection, reconnecting", self.channel)
+        self._connection = None
+        if self._reconnect_task is None:
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 0.5
+        try:
+            while not self._stopping:
+                # Jittered, so every process does not hit a recovering
+                # database at the same moment
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+                try:
+                    await self._connect()
+                except Exception as e:
+                    logger.warning("Reconnecting %s failed: %s", self.channel, e)
+                    delay = min(delay * 2, 30.0)
+                    continue
+                RECONNECTS.inc()
+                logger.info("Listening on %s again", self.channel)
+                self._buffer.clear()
+                self.close_subscriptions()
+                return
+        finally:
+            self._reconnect_task = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self._deliver(Event.from_json(payload))
+
+    async def publish_many(self, events: List[Event]):
+        if not events:
+            return
+        connection = self._connection
+        if connection is None:
+            PUBLISH_FAILED.inc(len(events))
+            logger.error("Not connected, dropping %d %s event(s)", len(events), events[0].type)
+            return
+        # One round trip however many events; NOTIFY payloads are capped at
+        # 8000 bytes, and order events are far smaller
+        payloads = [event.to_json() for event in events]
+        try:
+            async with self._publish_lock:
+                await connection.execute(
+                    "SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload",
+                    self.channel,
+                    payloads,
+                )
+        except Exception:
+            PUBLISH_FAILED.inc(len(events))
+            logger.exception("Publishing %d %s event(s) failed", len(events), events[0].type)
+
+
+def create_broker() -> InProcessBroker:
+    if EVENTS_BROKER == "postgres":
+        return PostgresNotifyBroker()
+    if EVENTS_BROKER != "memory":
+        raise ValueError(f"Unknown EVENTS_BROKER {EVENTS_BROKER!r} (expected memory or postgres)")
+    return InProcessBroker()
+
+
+broker = create_broker()
+
+# Set once the server has been told to exit. uvicorn waits for open
+# responses to finish before it runs the shutdown hooks, so streams have to
+# notice the exit signal themselves or shutdown hangs until they time out.
+_exiting = False
+# How often an idle stream checks _exiting
+_EXIT_POLL_SECONDS = 1.0
+
+
+def watch_exit_signals():
+    """
+    Wraps the SIGINT/SIGTERM handlers the server installed so open streams
+    close as soon as it starts shutting down. Call from a startup hook, once
+    the server's own handlers are in place.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return  # signals are only delivered to the main thread
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        if not callable(previous) or getattr(previous, "_closes_streams", False):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            global _exiting
+            # Only a flag: queues are not safe to touch from a signal handler
+            _exiting = True
+            previous(signum, frame)
+
+        handler._closes_streams = True
+        signal.signal(sig, handler)
+
+
+async def stream(user_id: Optional[int], last_event_id: Optional[str]) -> AsyncIterator[str]:
+    """
+    Server-Sent Events for one client: missed events first, then live ones,
+    with a comment line every EVENTS_HEARTBEAT_SECONDS so proxies keep the
+    connection open and dead clients are noticed.
+    """
+    subscription, missed = broker.subscribe(user_id, last_event_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + EVENTS_MAX_STREAM_SECONDS
+    try:
+        yield "retry: 3000\n\n"
+        if missed is None:
+            yield "event: reset\ndata: {}\n\n"
+        else:
+            for event in missed:
+                yield event.format_sse()
+        last_sent = loop.time()
+        while not _exiting and loop.time() < deadline:
+            try:
+                item = await subscription.get(_EXIT_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                if loop.time() - last_sent >= EVENTS_HEARTBEAT_SECONDS:
+                    yield ": heartbeat\n\n"
+                    last_sent = loop.time()
+                continue
+            if item is _CLOSED:
+                return
+            yield item.format_sse()
+            last_sent = loop.time()
+    finally:
+        subscription.close()
@@ -0,0 +1,131 @@
+import argparse
+import glob
+import os
+import re
+import shutil
+
+import cv2
+
+from .inference_backends import to_input_tensor
+from .model_config import ONNX_INT8_MODEL_PATH, ONNX_MODEL_PATH, TRAINED_MODEL_PATH
+
+# Builds the artifacts for AI_BACKEND=onnx / onnx-int8 from a trained
+# checkpoint:
+#
+#   python -m backend.export_model                 # FP32 ONNX only
+#   python -m backend.export_model --int8          # plus static INT8, calibrated
+#                                                  # on laundry_data/images/val
+#
+# Then check accuracy/latency with `python -m backend.compare_backends`.
+
+CALIBRATION_DIR = os.path.join(os.path.dirname(__file__), "..", "laundry_data", "images", "val")
+
+
+def find_checkpoint() -> str:
+    if os.path.exists(TRAINED_MODEL_PATH):
+        return TRAINED_MODEL_PATH
+    candidates = glob.glob(os.path.join("runs", "detect", "*", "weights", "best.pt"))
+    if not candidates:
+        raise SystemExit("No checkpoint found; train one with train_model.py or pass --weights")
+    return max(candidates, key=os.path.getmtime)
+
+
+def export_onnx(weights: str, output: str, imgsz: int) -> str:
+    from ultralytics import YOLO
+
+    print(f"Exporting {weights} to ONNX (imgsz={imgsz})...")
+    # dynamic=True keeps the batch axis free so the micro-batcher can send
+    # several images per run
+    exported = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    if os.path.abspath(exported) != os.path.abspath(output):
+        shutil.move(exported, output)
+    print(f"FP32 model written to {output}")
+    return output
+
+
+class ValImageReader:
+    """
+    Feeds preprocessed validation images to the static quantizer so it can
+    pick activation ranges from real garment photos.
+    """
+
+    def __init__(self, input_name: str, image_dir: str, imgsz: int, limit: int):
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self.paths = sorted(glob.glob(os.path.join(image_dir, "*.jpg")))[:limit]
+        if not self.paths:
+            raise SystemExit(f"No calibration images found in {image_dir}")
+        self._iter = iter(self.paths)
+
+    def get_next(self):
+        path = next(self._iter, None)
+        if path is None:
+            return None
+        return {self.input_name: to_input_tensor([cv2.imread(path, cv2.IMREAD_COLOR)], self.imgsz)}
+
+    def rewind(self):
+        self._iter = iter(self.paths)
+
+
+def detect_head_nodes(model) -> list:
+    """
+    Names of the nodes in the final Detect block. Keeping the box/score
+    decoding in FP32 avoids most of the accuracy loss of INT8 YOLO models.
+    """
+    blocks = {}
+    for node in model.graph.node:
+        match = re.match(r"/model\.(\d+)/", node.name)
+        if match:
+            blocks.setdefault(int(match.group(1)), []).append(node.name)
+    return blocks[max(blocks)] if blocks else []
+
+
+def quantize_int8(fp32_path: str, output: str, imgsz: int, calibration_dir: str, limit: int) -> str:
+    import onnx
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class Reader(ValImageReader, CalibrationDataReader):
+        pass
+
+    input_name = ort.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    fp32_model = onnx.load(fp32_path)
+
+    print(f"Calibrating INT8 model on {calibration_dir}...")
+    quantize_static(
+        fp32_path,
+        output,
+        Reader(input_name, calibration_dir, imgsz, limit),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        nodes_to_exclude=detect_head_nodes(fp32_model),
+    )
+
+    # Carry over the class names / imgsz metadata the backend reads
+    int8_model = onnx.load(output)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, output)
+    print(f"INT8 model written to {output}")
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the trained model to ONNX (and INT8)")
+    parser.add_argument("--weights", help="checkpoint to export (default: newest runs/detect/*/weights/best.pt)")
+    parser.add_argument("--imgsz", type=int, default=320, help="input size; train_model.py trains at 320")
+    parser.add_argument("--int8", action="store_true", help="also build a statically quantized INT8 model")
+    parser.add_argument("--calibration-dir", default=CALIBRATION_DIR)
+    parser.add_argument("--calibration-images", type=int, default=100)
+    args = parser.parse_args()
+
+    weights = args.weights or find_checkpoint()
+    fp32_path = export_onnx(weights, ONNX_MODEL_PATH, args.imgsz)
+    if args.int8:
+        quantize_int8(fp32_path, ONNX_INT8_MODEL_PATH, args.imgsz, args.calibration_dir, args.calibration_images)
+
+
+if __name__ == "__main__":
+    main()
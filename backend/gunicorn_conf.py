@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+
+from dotenv import load_dotenv
+
+from backend import serving
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+# Production server: one master and WEB_CONCURRENCY uvicorn workers forked
+# from it after the app and the model are loaded (preload_app), so the
+# weights and the torch runtime are in memory once, not once per worker.
+#
+#   gunicorn -c backend/gunicorn_conf.py backend.main:app
+#
+# Each worker runs inference on its own thread (AI_WORKERS=0) with
+# AI_THREADS_PER_WORKER intra-op threads, by default an even split of the
+# cores, and is replaced after MAX_REQUESTS requests (plus up to
+# MAX_REQUESTS_JITTER, so workers do not all restart at once). Measure
+# memory and throughput per worker count with `python -m backend.bench_workers`.
+#
+# Workers share their metrics through METRICS_DIR (by default a new temp
+# directory per server), so each /metrics scrape, whichever worker answers
+# it, covers all of them.
+
+CPUS = os.cpu_count() or 1
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", CPUS))
+
+# Read by the app when the master imports it below, so set them first
+os.environ.setdefault("AI_WORKERS", "0")
+os.environ.setdefault("AI_THREADS_PER_WORKER", str(max(1, CPUS // WEB_CONCURRENCY)))
+# Order events and auth cache invalidations have to reach every worker
+os.environ.setdefault("EVENTS_BROKER", "postgres")
+# The master creates the schema once (on_starting), before any worker runs
+os.environ.setdefault("CREATE_SCHEMA_ON_STARTUP", "false")
+_own_metrics_dir = not os.getenv("METRICS_DIR")
+if _own_metrics_dir:
+    os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="freshai-metrics-")
+
+if WEB_CONCURRENCY > 1 and os.environ["EVENTS_BROKER"] == "memory":
+    raise SystemExit(
+        "EVENTS_BROKER=memory only reaches the worker that published; "
+        "use EVENTS_BROKER=postgres with WEB_CONCURRENCY > 1"
+    )
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = WEB_CONCURRENCY
+worker_class = "backend.serving.ServingWorker"
+preload_app = os.getenv("PRELOAD_APP", "true").lower() == "true"
+
+max_requests = int(os.getenv("MAX_REQUESTS", 10000))
+# gunicorn adds the jitter even to 0, so MAX_REQUESTS=0 alone would not
+# turn recycling off
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", 1000)) if max_requests else 0
+graceful_timeout = serving.GRACEFUL_TIMEOUT
+# A worker that has not checked in for this long is killed and replaced
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+keepalive = 5
+
+accesslog = None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "INFO").lower()
+
+on_starting = serving.on_starting
+when_ready = serving.when_ready
+post_fork = serving.post_fork
+child_exit = serving.child_exit
+
+
+def on_exit(server):
+    if _own_metrics_dir:
+        shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
@@ -0,0 +1,66 @@
+import time
+from typing import Iterable
+
+from .metrics import Counter, Histogram
+
+# Request metrics for every HTTP endpoint, labelled by the route template
+# ("/orders/{order_id}"), never the raw path, so order IDs and scanners
+# probing random URLs cannot create new series. Requests that match no
+# route share the "unmatched" label.
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the end of its response",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+REQUESTS = Counter("http_requests_total", "Requests handled", ["method", "route", "status"])
+
+_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_template(scope) -> str:
+    # Set by the router once a route has matched
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every HTTP request. For `streaming_routes` (long-lived responses
+    such as event streams) the time to the response headers is recorded
+    instead, since their total duration is just how long the client stayed.
+    Add it last so it is the outermost middleware and sees the full cost.
+    """
+
+    def __init__(self, app, streaming_routes: Iterable[str] = ()):
+        self.app = app
+        self.streaming_routes = frozenset(streaming_routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        headers_sent = None
+
+        async def timed_send(message):
+            nonlocal status, headers_sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers_sent = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            end = time.perf_counter()
+            method = scope["method"] if scope["method"] in _METHODS else "other"
+            route = route_template(scope)
+            if route in self.streaming_routes and headers_sent is not None:
+                end = headers_sent
+            REQUEST_SECONDS.observe(end - start, method=method, route=route)
+            REQUESTS.inc(method=method, route=route, status=f"{status // 100}xx")
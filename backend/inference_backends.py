@@ -0,0 +1,191 @@
+import ast
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# A detection is the single most confident (label, confidence) pair in an
+# image, or None when nothing cleared the threshold. That is all the API
+# needs, so every backend reduces its raw output to this.
+Detection = Optional[Tuple[str, float]]
+
+# detect_boxes() returns every box that survives NMS instead, as an (n, 6)
+# array per image: x1, y1, x2, y2 (normalized to the image), confidence,
+# class id, most confident first. Only evaluation needs those.
+Boxes = np.ndarray
+
+# Every detect() takes an optional `timings` dict and adds the seconds the
+# batch spent in each stage to it: "preprocess", "forward", "postprocess".
+Timings = Optional[Dict[str, float]]
+
+
+def _add(timings: Timings, stage: str, seconds: float):
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+class UltralyticsBackend:
+    """
+    The original path: ultralytics' YOLO wrapper running the .pt
+    checkpoint on PyTorch.
+    """
+
+    name = "torch"
+
+    def __init__(self, path: str, imgsz: Optional[int] = None):
+        from ultralytics import YOLO
+        self.model = YOLO(path)
+        self.names: Dict[int, str] = self.model.names
+        # None keeps the size the checkpoint was trained at
+        self.imgsz = imgsz
+
+    def _predict(self, images: List[np.ndarray], conf: float):
+        options = {"imgsz": self.imgsz} if self.imgsz else {}
+        return self.model.predict(source=images, save=False, conf=conf, verbose=False, **options)
+
+    def detect(self, images: List[np.ndarray], conf: float, timings: Timings = None) -> List[Detection]:
+        results = self._predict(images, conf)
+        # ultralytics times its own stages, in milliseconds per image
+        speed = getattr(results[0], "speed", None) if results else None
+        if speed:
+            for stage, key in (("preprocess", "preprocess"), ("forward", "inference"), ("postprocess", "postprocess")):
+                _add(timings, stage, (speed.get(key) or 0.0) * len(images) / 1000)
+        detections = []
+        for result in results:
+            if result.boxes:
+                # Boxes come back sorted, so the first is the most confident
+                box = result.boxes[0]
+                detections.append((self.names[int(box.cls[0])], float(box.conf[0])))
+            else:
+                detections.append(None)
+        return detections
+
+    def detect_boxes(self, images: List[np.ndarray], conf: float) -> List[Boxes]:
+        boxes = []
+        for result in self._predict(images, conf):
+            found = result.boxes
+            boxes.append(np.column_stack([
+                found.xyxyn.cpu().numpy(), found.conf.cpu().numpy(), found.cls.cpu().numpy()
+            ]).reshape(-1, 6))
+        return boxes
+
+
+def letterbox_geometry(height: int, width: int, size: int) -> Tuple[float, int, int, int, int]:
+    # Scale, resized width and height, and the left/top padding
+    scale = min(size / height, size / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    return scale, new_w, new_h, (size - new_w) // 2, (size - new_h) // 2
+
+
+def letterbox(image: np.ndarray, size: int) -> np.ndarray:
+    """
+    Resizes keeping the aspect ratio and pads to a square with the same
+    grey (114) ultralytics uses, so ONNX inputs match what the torch path sees.
+    """
+    height, width = image.shape[:2]
+    _, new_w, new_h, left, top = letterbox_geometry(height, width, size)
+    if (new_w, new_h) != (width, height):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_w, pad_h = size - new_w, size - new_h
+    return cv2.copyMakeBorder(
+        image, top, pad_h - top, left, pad_w - left, cv2.BORDER_CONSTANT, value=(114, 114, 114)
+    )
+
+
+def to_input_tensor(images: List[np.ndarray], size: int) -> np.ndarray:
+    # BGR HWC uint8 -> RGB NCHW float32 in [0, 1]
+    batch = np.stack([letterbox(image, size) for image in images])
+    batch = batch[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+
+class OnnxBackend:
+    """
+    Runs an ONNX export of the checkpoint (see export_model.py) on ONNX
+    Runtime's CPU provider. Works for both the FP32 and the INT8 model.
+    """
+
+    name = "onnx"
+
+    # NMS settings of ultralytics' predict, used by detect_boxes()
+    iou_threshold = 0.7
+    max_detections = 300
+
+    def __init__(self, path: str, threads: Optional[int] = None, imgsz: Optional[int] = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+        # ultralytics writes the class names and input size into the metadata
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names: Dict[int, str] = ast.literal_eval(metadata["names"])
+        exported = ast.literal_eval(metadata.get("imgsz", "[640, 640]"))
+        exported = exported[0] if isinstance(exported, (list, tuple)) else int(exported)
+        self.imgsz = imgsz or exported
+        if self.imgsz != exported:
+            # Only a dynamic export (the default in export_model.py) accepts
+            # other sizes, and only multiples of the model's stride
+            height = self.session.get_inputs()[0].shape[2]
+            if isinstance(height, int):
+                raise ValueError(f"{path} only accepts {height}px input; re-export it with --imgsz {self.imgsz}")
+            if self.imgsz % 32:
+                raise ValueError(f"ONNX input size must be a multiple of 32, got {self.imgsz}")
+
+    def detect(self, images: List[np.ndarray], conf: float, timings: Timings = None) -> List[Detection]:
+        start = time.perf_counter()
+        batch = to_input_tensor(images, self.imgsz)
+        preprocessed = time.perf_counter()
+        # Output is (batch, 4 + num_classes, anchors); rows 4: are class scores
+        output = self.session.run(None, {self.input_name: batch})[0]
+        forwarded = time.perf_counter()
+        scores = output[:, 4:, :]
+        detections = []
+        for image_scores in scores:
+            class_id, anchor = np.unravel_index(np.argmax(image_scores), image_scores.shape)
+            confidence = float(image_scores[class_id, anchor])
+            # The top-scoring anchor always survives NMS, so this matches
+            # boxes[0] on the torch path without running NMS at all
+            detections.append((self.names[int(class_id)], confidence) if confidence >= conf else None)
+        _add(timings, "preprocess", preprocessed - start)
+        _add(timings, "forward", forwarded - preprocessed)
+        _add(timings, "postprocess", time.perf_counter() - forwarded)
+        return detections
+
+    def detect_boxes(self, images: List[np.ndarray], conf: float) -> List[Boxes]:
+        output = self.session.run(None, {self.input_name: to_input_tensor(images, self.imgsz)})[0]
+        boxes = []
+        for image, prediction in zip(images, output):
+            scores = prediction[4:, :]
+            class_ids = np.argmax(scores, axis=0)
+            confidences = scores[class_ids, np.arange(scores.shape[1])]
+            keep = confidences >= conf
+            # Centre x/y, width, height in letterboxed input pixels
+            cx, cy, w, h = prediction[:4, keep]
+            class_ids, confidences = class_ids[keep], confidences[keep]
+            height, width = image.shape[:2]
+            scale, _, _, left, top = letterbox_geometry(height, width, self.imgsz)
+            xywh = np.stack([(cx - w / 2 - left) / scale, (cy - h / 2 - top) / scale, w / scale, h / scale], axis=1)
+            kept = cv2.dnn.NMSBoxesBatched(
+                xywh.tolist(), confidences.tolist(), class_ids.tolist(), conf, self.iou_threshold
+            )
+            kept = np.asarray(kept, dtype=int).reshape(-1)[: self.max_detections]
+            xyxy = np.column_stack([xywh[kept, :2], xywh[kept, :2] + xywh[kept, 2:]])
+            xyxy = np.clip(xyxy / [width, height, width, height], 0, 1)
+            found = np.column_stack([xyxy, confidences[kept], class_ids[kept]]).reshape(-1, 6)
+            boxes.append(found[np.argsort(-found[:, 4], kind="stable")])
+        return boxes
+
+
+def load_backend(kind: str, path: str, threads: Optional[int] = None, imgsz: Optional[int] = None):
+    if kind == "torch":
+        return UltralyticsBackend(path, imgsz=imgsz)
+    if kind in ("onnx", "onnx-int8"):
+        return OnnxBackend(path, threads=threads, imgsz=imgsz)
+    raise ValueError(f"Unknown AI_BACKEND '{kind}' (expected torch, onnx or onnx-int8)")
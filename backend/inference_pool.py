@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple, Union
+
+from dotenv import load_dotenv
+
+from .metrics import Counter, Gauge, Histogram
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+logger = logging.getLogger(__name__)
+
+# Number of inference processes. 0 runs inference on a single background
+# thread inside the API process instead (handy for local development).
+AI_WORKERS = int(os.getenv("AI_WORKERS", 1))
+# Intra-op threads per worker. Defaults to an even split of the cores so
+# workers x threads never exceeds the machine.
+AI_THREADS_PER_WORKER = int(
+    os.getenv("AI_THREADS_PER_WORKER", max(1, (os.cpu_count() or 1) // max(1, AI_WORKERS)))
+)
+
+WORKER_RESTARTS = Counter("ai_worker_restarts_total", "Inference pool restarts after a worker crashed")
+WORKERS_CONFIGURED = Gauge("ai_workers", "Configured inference worker processes")
+# Per batch. Workers measure decode/preprocess/forward/postprocess and send
+# the numbers back with the results; "dispatch" is what is left of the wall
+# time seen here (executor queueing and pickling images and results).
+STAGE_SECONDS = Histogram(
+    "ai_inference_stage_seconds",
+    "Time a batch spent in each inference stage",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def _configure_threads(threads: int):
+    # Must run before torch is imported to take full effect
+    for var in _THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    import cv2
+    cv2.setNumThreads(1)
+    try:
+        import torch
+    except ImportError:
+        # ONNX-only deployments do not ship torch
+        return
+    torch.set_num_threads(threads)
+
+
+def _init_worker(threads: int):
+    """
+    Runs once in every worker process: caps its thread count, loads the
+    model and runs a warm-up inference so requests never pay for it.
+    """
+    _configure_threads(threads)
+    from .log_config import configure_logging
+    configure_logging()
+    from .ai_service import warm_up
+    warm_up()
+
+
+def warm_up_worker() -> Dict[str, float]:
+    from .ai_service import warm_up
+    return warm_up()
+
+
+def run_batch(images: List[bytes]) -> Tuple[List[Union[Dict[str, str], Exception]], Dict[str, float]]:
+    """
+    Worker-side entry point, returning the results and per-stage timings.
+    Importing ai_service here rather than at module level keeps the model
+    out of the API process.
+    """
+    from .ai_service import analyze_images_bytes
+    timings: Dict[str, float] = {}
+    results = analyze_images_bytes(images, timings)
+    return results, timings
+
+
+class InferencePool:
+    """
+    Owns the executor that runs inference. `run` is awaited from request
+    handlers; if a worker process dies the pool is rebuilt and the batch
+    is retried once.
+    """
+
+    def __init__(self, workers: int = AI_WORKERS, threads_per_worker: int = AI_THREADS_PER_WORKER):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self._executor: Optional[Union[ProcessPoolExecutor, ThreadPoolExecutor]] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def concurrency(self) -> int:
+        return max(1, self.workers)
+
+    def _create_executor(self):
+        if self.workers <= 0:
+            _configure_threads(self.threads_per_worker)
+            return ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        # spawn, not fork: torch's thread pools do not survive a fork
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker,),
+        )
+
+    def start(self):
+        if self._executor is None:
+            self._executor = self._create_executor()
+            WORKERS_CONFIGURED.set(self.workers)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def _restart(self, broken):
+        async with self._lock:
+            # Another batch may already have replaced the broken executor
+            if self._executor is broken:
+                logger.error("Inference worker crashed, restarting pool")
+                WORKER_RESTARTS.inc()
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._create_executor()
+
+    async def warm_up(self) -> Dict[str, float]:
+        """
+        Makes sure every worker has loaded the model and run a warm-up
+        inference. One task per worker is submitted at once, which makes
+        the executor spawn all of its processes. Returns the slowest
+        worker's timings.
+        """
+        loop = asyncio.get_running_loop()
+        timings = await asyncio.gather(
+            *[loop.run_in_executor(self._executor, warm_up_worker) for _ in range(self.concurrency)]
+        )
+        return {name: max(t[name] for t in timings) for name in timings[0]}
+
+    async def run(self, images: List[bytes]) -> List[Union[Dict[str, str], Exception]]:
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self._executor
+            if executor is None:
+                raise RuntimeError("Inference pool is not running")
+            try:
+                start = time.perf_counter()
+                results, timings = await loop.run_in_executor(executor, run_batch, images)
+            except BrokenProcessPool:
+                await self._restart(executor)
+                if attempt:
+                    raise
+                continue
+            elapsed = time.perf_counter() - start
+            for stage, seconds in timings.items():
+                STAGE_SECONDS.observe(seconds, stage=stage)
+            STAGE_SECONDS.observe(max(0.0, elapsed - sum(timings.values())), stage="dispatch")
+            return results
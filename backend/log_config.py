@@ -0,0 +1,214 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from .metrics import Counter
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+# Logging for the API and the inference workers. Modules log through
+# logging.getLogger(__name__); records go onto an in-memory queue and a
+# background thread formats and writes them, so a request never blocks on
+# stdout (or on whatever is reading it). Every record carries the ID of
+# the request it was logged from, and DEBUG records are sampled per
+# request so they can stay enabled under load.
+#
+# LOG_LEVEL         - minimum level for this app's loggers (default INFO)
+# LOG_FORMAT        - "json" (one object per line) or "text"
+# LOG_QUEUE_SIZE    - records buffered before new ones are dropped
+# LOG_DEBUG_SAMPLE  - share of requests whose DEBUG records are kept
+#
+# Messages are formatted in the background too, so log values rather than
+# objects that the request goes on to modify.
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_DEBUG_SAMPLE = float(os.getenv("LOG_DEBUG_SAMPLE", 0.01))
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# Incoming IDs are reused only if they look like an ID, not arbitrary text
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+DROPPED = Counter("log_records_dropped_total", "Log records discarded because the log queue was full")
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[QueueListener] = None
+_handler: Optional["NonBlockingQueueHandler"] = None
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Stamps records with the current request ID (read here, on the caller's
+    thread, since the context is gone once the record is queued) and drops
+    DEBUG records from requests outside the sample.
+    """
+
+    def __init__(self, debug_sample: float = LOG_DEBUG_SAMPLE):
+        super().__init__()
+        self.debug_sample = debug_sample
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = request_id_var.get()
+        record.request_id = request_id
+        if record.levelno > logging.DEBUG or self.debug_sample >= 1:
+            return True
+        # Keyed on the request, so a sampled request keeps all of its
+        # DEBUG lines and the rest keep none
+        if request_id is not None:
+            return zlib.crc32(request_id.encode()) % 10000 < self.debug_sample * 10000
+        return random.random() < self.debug_sample
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queues records without formatting them; the listener thread does the
+    formatting. When the queue is full the record is dropped and counted
+    rather than making the caller wait.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only what cannot wait: a traceback is rendered now, while it still
+        # describes the exception being handled
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.request_id:
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """
+    Routes this app's loggers (and anything else that propagates to the
+    root logger) through the background queue. Safe to call more than
+    once; later calls are ignored.
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    _handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    # The root logger stays at WARNING so third-party libraries stay quiet;
+    # only this package follows LOG_LEVEL
+    if root.level == logging.NOTSET or root.level > logging.WARNING:
+        root.setLevel(logging.WARNING)
+    logging.getLogger(__package__).setLevel(level)
+
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def reset_after_fork():
+    """
+    For a process forked after logging was configured (a pre-fork server's
+    workers): the listener thread did not survive the fork, and the queue's
+    lock may have been held when it happened. Gives the handler a new queue
+    and starts a listener for it.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _listener = QueueListener(_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Writes out whatever is still queued and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+class RequestIDMiddleware:
+    """
+    Gives every HTTP request an ID (the caller's X-Request-ID if it sent a
+    sensible one), makes it available to log records for the duration of
+    the request, and echoes it in the response so clients can quote it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers") or ():
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if _VALID_REQUEST_ID.match(candidate):
+                    request_id = candidate
+                break
+        request_id = request_id or new_request_id()
+        header = (REQUEST_ID_HEADER.lower().encode(), request_id.encode())
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), header]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
@@ -1,14 +1,31 @@
+import time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from sqlmodel import Session, select
 from dotenv import load_dotenv
 import os
 import uvicorn
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from . import auth, orders
-from .database import engine, create_db_and_tables
+from . import ai, analytics, auth, orders
+from .metrics import Gauge, render_latest, stop_sharing
+from .notifications import notifier
+from .events import broker, watch_exit_signals
+from .http_metrics import RequestMetricsMiddleware
+from .log_config import REQUEST_ID_HEADER, RequestIDMiddleware, configure_logging, stop_logging
+from .database import async_engine, engine, create_db_and_tables
+from .responses import add_compression
+from .uploads import UploadLimitMiddleware
 
 load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
 
+configure_logging()
+
+# Off under gunicorn, whose master creates the schema before forking
+CREATE_SCHEMA_ON_STARTUP = os.getenv("CREATE_SCHEMA_ON_STARTUP", "true").lower() == "true"
+
 app = FastAPI(title="FreshAI Backend")
 
 app.add_middleware(
@@ -17,24 +34,50 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[orders.NEXT_CURSOR_HEADER, REQUEST_ID_HEADER, "Retry-After"],
 )
 
+app.add_middleware(UploadLimitMiddleware, limits=ai.UPLOAD_LIMITS)
+
+add_compression(app)
+
+# Outermost, so request timings include every other middleware
+app.add_middleware(RequestMetricsMiddleware, streaming_routes=["/orders/events"])
+
+# Outside even that, so anything logged while handling a request carries its ID
+app.add_middleware(RequestIDMiddleware)
+
 app.include_router(auth.router)
 
 app.include_router(orders.router)
 
-from fastapi import UploadFile, File
-from .ai_service import analyze_image_bytes
+app.include_router(ai.router)
+
+app.include_router(analytics.router)
 
-@app.post("/ai/analyze")
-async def analyze_laundry(file: UploadFile = File(...)):
-    contents = await file.read()
-    result = analyze_image_bytes(contents)
-    return result
+IMPORT_SECONDS = Gauge("app_import_seconds", "Time to import backend.main and build the app", multiprocess="max")
+IMPORT_SECONDS.set(time.perf_counter() - _import_started)
 
 @app.on_event("startup")
-def on_startup():
-    create_db_and_tables()
+async def on_startup():
+    if CREATE_SCHEMA_ON_STARTUP:
+        await run_in_threadpool(create_db_and_tables)
+        await run_in_threadpool(analytics.create_rollup_view)
+    analytics.start_refresh()
+    await ai.start_inference()
+    await notifier.start()
+    await broker.start()
+    watch_exit_signals()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await broker.stop()
+    await ai.stop_inference()
+    await notifier.stop()
+    await analytics.stop_refresh()
+    await async_engine.dispose()
+    stop_sharing()
+    stop_logging()
 
 @app.get("/")
 def read_root():
@@ -44,18 +87,30 @@ def read_root():
 def ping():
     return {"status": "pong"}
 
+@app.get("/healthz")
+def liveness():
+    # Liveness: the process is up and serving; says nothing about the model
+    return {"status": "alive"}
+
+@app.get("/readyz")
+def readiness():
+    # Readiness: only route traffic here once the model is warm
+    if not ai.model_ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return render_latest()
+
 @app.get("/db-check")
 def check_db():
-    print(f"Endpoint DEBUG: Checking DB with URL: {engine.url}")
     try:
         with Session(engine) as session:
-            print("Endpoint DEBUG: Session created")
             # Try a simple query
             session.exec(select(1))
-            print("Endpoint DEBUG: Query executed")
         return {"status": "connected", "database": "PostgreSQL"}
     except Exception as e:
-        print(f"Endpoint DEBUG: Error {e}")
         return {"status": "error", "message": str(e)}
 
 if __name__ == "__main__":
@@ -0,0 +1,342 @@
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Minimal in-process metrics registry rendered in the Prometheus text format.
+# Kept dependency-free on purpose: every instrument is a few dict lookups
+# under a lock, so it is cheap enough to call on the request path.
+#
+# Several processes serving one app (gunicorn workers) share their metrics
+# through METRICS_DIR: each writes a snapshot of its registry there every
+# METRICS_WRITE_SECONDS, and /metrics, whichever worker answers, merges
+# them. Counters and histograms are summed; each gauge says how its values
+# combine (Gauge(multiprocess=...)). When a worker exits, the master folds
+# its counters and histograms into an archive file, so totals never go
+# backwards when workers are recycled; its gauges are dropped.
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_WRITE_SECONDS = float(os.getenv("METRICS_WRITE_SECONDS", 5))
+_ARCHIVE = "archive.json"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        # A list comprehension: about twice as fast as a generator here,
+        # and this runs on every observation
+        return tuple([str(labels.get(name, "")) for name in self.labelnames])
+
+    def render(self, items: Optional[list] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._lines(self._items() if items is None else items))
+        return lines
+
+    def _items(self) -> list:
+        # (label values, value) pairs, copied under the lock
+        with self._lock:
+            return list(self._values.items())
+
+    def _lines(self, items: list) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+    def _reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def _merge(self, parts: List[Tuple[str, list]]) -> list:
+        # `parts`: (process, snapshot items) pairs; values are summed
+        merged: Dict[Tuple[str, ...], float] = {}
+        for _, items in parts:
+            for key, value in items:
+                key = tuple(key)
+                merged[key] = merged.get(key, 0.0) + value
+        return list(merged.items())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    """
+    `multiprocess` says how values from several processes combine when
+    metrics are shared (see METRICS_DIR): "sum" (in-flight work, queue
+    depths), "max" or "min" (e.g. "min" for a readiness flag), or "all" to
+    keep one series per process under a `pid` label.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), multiprocess: str = "sum"):
+        if multiprocess not in ("sum", "max", "min", "all"):
+            raise ValueError(f"Unknown multiprocess mode {multiprocess!r}")
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess = multiprocess
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _merge(self, parts: List[Tuple[str, list]]) -> list:
+        if self.multiprocess == "sum":
+            return super()._merge(parts)
+        if self.multiprocess == "all":
+            return [(tuple(key) + (process,), value) for process, items in parts for key, value in items]
+        pick = max if self.multiprocess == "max" else min
+        merged: Dict[Tuple[str, ...], float] = {}
+        for _, items in parts:
+            for key, value in items:
+                key = tuple(key)
+                merged[key] = pick(merged[key], value) if key in merged else value
+        return list(merged.items())
+
+    def render(self, items: Optional[list] = None) -> List[str]:
+        if items is None or self.multiprocess != "all":
+            return super().render(items)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        labelnames = self.labelnames + ("pid",)
+        lines.extend(f"{self.name}{_format_labels(labelnames, key)} {value}" for key, value in items)
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = ([0] * (len(self.buckets) + 1), [0.0])
+                self._values[key] = state
+            state[0][index] += 1
+            state[1][0] += value
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def _items(self) -> list:
+        with self._lock:
+            return [(key, (list(counts), total[0])) for key, (counts, total) in self._values.items()]
+
+    def _merge(self, parts: List[Tuple[str, list]]) -> list:
+        merged: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+        for _, items in parts:
+            for key, (counts, total) in items:
+                key = tuple(key)
+                if key in merged:
+                    previous_counts, previous_total = merged[key]
+                    counts = [a + b for a, b in zip(previous_counts, counts)]
+                    total += previous_total
+                merged[key] = (list(counts), total)
+        return list(merged.items())
+
+    def _lines(self, items: list) -> List[str]:
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += counts[-1]
+            le = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _metrics() -> List[_Metric]:
+    with _registry_lock:
+        return list(_registry)
+
+
+def render_latest() -> str:
+    """This process's metrics, or every process's once share_across_processes() has run."""
+    if _shared_path is not None:
+        return _render_shared()
+    lines: List[str] = []
+    for metric in _metrics():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Sharing across processes (METRICS_DIR)
+
+_shared_path: Optional[str] = None
+_writer: Optional[threading.Thread] = None
+_writer_stop = threading.Event()
+
+
+def _snapshot(kinds: Sequence[str] = ("counter", "gauge", "histogram")) -> dict:
+    return {metric.name: [[list(key), value] for key, value in metric._items()] for metric in _metrics() if metric.kind in kinds}
+
+
+def _write_json(path: str, data: dict):
+    # Through a temp file and os.replace, so readers never see half a file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _read_json(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_snapshot():
+    if _shared_path is None:
+        return
+    try:
+        _write_json(_shared_path, _snapshot())
+    except OSError:
+        logger.exception("Could not write metrics to %s", _shared_path)
+
+
+def share_across_processes(directory: str = METRICS_DIR, interval: float = METRICS_WRITE_SECONDS):
+    """
+    Call in each forked worker. Drops counts inherited from the parent
+    (archive_pre_fork() has kept them) and starts writing this process's
+    snapshot to `directory`.
+    """
+    global _shared_path, _writer
+    for metric in _metrics():
+        if metric.kind != "gauge":
+            metric._reset()
+    _shared_path = os.path.join(directory, f"{os.getpid()}.json")
+    write_snapshot()
+    _writer_stop.clear()
+
+    def run():
+        while not _writer_stop.wait(interval):
+            write_snapshot()
+
+    _writer = threading.Thread(target=run, name="metrics-writer", daemon=True)
+    _writer.start()
+
+
+def stop_sharing():
+    """Writes a final snapshot; call when the worker shuts down."""
+    _writer_stop.set()
+    write_snapshot()
+
+
+def _add_to_archive(directory: str, snapshot: dict):
+    archive_path = os.path.join(directory, _ARCHIVE)
+    archive = _read_json(archive_path)
+    for metric in _metrics():
+        if metric.kind == "gauge" or metric.name not in snapshot:
+            continue
+        parts = [("archive", archive.get(metric.name, [])), ("process", snapshot[metric.name])]
+        archive[metric.name] = [[list(key), value] for key, value in metric._merge(parts)]
+    _write_json(archive_path, archive)
+
+
+def archive_pre_fork(directory: str = METRICS_DIR):
+    """In the master before forking: keeps what it has counted so far (startup work)."""
+    _add_to_archive(directory, _snapshot(("counter", "histogram")))
+
+
+def archive_process(pid: int, directory: str = METRICS_DIR):
+    """
+    In the master once a worker has exited: folds its counters and
+    histograms into the archive and drops its gauges.
+    """
+    path = os.path.join(directory, f"{pid}.json")
+    if not os.path.exists(path):
+        return
+    _add_to_archive(directory, _read_json(path))
+    os.remove(path)
+
+
+def _render_shared() -> str:
+    write_snapshot()
+    directory = os.path.dirname(_shared_path)
+    archive = _read_json(os.path.join(directory, _ARCHIVE))
+    live = []
+    for path in sorted(glob.glob(os.path.join(directory, "[0-9]*.json"))):
+        live.append((os.path.basename(path)[: -len(".json")], _read_json(path)))
+    lines: List[str] = []
+    for metric in _metrics():
+        parts = [(process, snapshot.get(metric.name, [])) for process, snapshot in live]
+        if metric.kind != "gauge":
+            parts.append(("archive", archive.get(metric.name, [])))
+        lines.extend(metric.render(metric._merge(parts)))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,62 @@
+import hashlib
+import os
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+# Model settings shared by the API process and the inference workers.
+# Nothing here imports torch/ultralytics, so it is cheap to import anywhere.
+
+# Check for custom trained model, else fallback to standard
+# "yolov8n.pt" will be downloaded automatically from Ultralytics
+TRAINED_MODEL_PATH = os.getenv(
+    "AI_MODEL_PATH",
+    os.path.join(os.getcwd(), "runs", "detect", "train3", "weights", "best.pt"),
+)
+FALLBACK_MODEL = "yolov8n.pt"
+
+# Model input size. Uploads are decoded straight to at most this many pixels
+# on the longest side and letterboxed to it; the model was trained at
+# imgsz=320 (train_model.py). Must be a multiple of 32. Compare sizes with
+# `python -m backend.bench_inference`.
+AI_INPUT_SIZE = int(os.getenv("AI_INPUT_SIZE", 320))
+
+# Inference backend: "torch" (ultralytics on PyTorch), "onnx" (FP32 export on
+# ONNX Runtime) or "onnx-int8" (statically quantized export). Build the ONNX
+# artifacts with `python -m backend.export_model`.
+AI_BACKEND = os.getenv("AI_BACKEND", "torch")
+ONNX_MODEL_PATH = os.getenv("AI_ONNX_MODEL_PATH", os.path.splitext(TRAINED_MODEL_PATH)[0] + ".onnx")
+ONNX_INT8_MODEL_PATH = os.getenv(
+    "AI_ONNX_INT8_MODEL_PATH", os.path.splitext(TRAINED_MODEL_PATH)[0] + ".int8.onnx"
+)
+
+# Confidence threshold passed to every predict call (lower to catch distinct
+# features). bench_inference reports precision, recall and recommendation
+# agreement per threshold.
+CONFIDENCE_THRESHOLD = float(os.getenv("AI_CONFIDENCE_THRESHOLD", 0.10))
+
+def model_source() -> str:
+    if os.path.exists(TRAINED_MODEL_PATH):
+        return TRAINED_MODEL_PATH
+    return FALLBACK_MODEL
+
+def served_model_path(backend: str = AI_BACKEND) -> str:
+    if backend == "onnx":
+        return ONNX_MODEL_PATH
+    if backend == "onnx-int8":
+        return ONNX_INT8_MODEL_PATH
+    return model_source()
+
+def model_version(backend: str = AI_BACKEND) -> str:
+    """
+    Short fingerprint of the weights that will be served and the input size
+    they run at. Changes whenever the checkpoint is retrained or swapped, so
+    anything keyed on it (e.g. the result cache) is invalidated automatically.
+    """
+    source = served_model_path(backend)
+    if os.path.exists(source):
+        stat = os.stat(source)
+        identity = f"{backend}:{os.path.abspath(source)}:{stat.st_size}:{int(stat.st_mtime)}:{AI_INPUT_SIZE}"
+    else:
+        identity = f"{backend}:{source}:{AI_INPUT_SIZE}"
+    return hashlib.sha256(identity.encode()).hexdigest()[:12]
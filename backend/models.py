@@ -1,6 +1,11 @@
-from typing import Optional
+from typing import Callable, List, Optional
+from pydantic import EmailStr, field_validator
+from sqlalchemy import Index, Sequence, event, text
+from sqlalchemy.orm import Session, object_session
 from sqlmodel import Field, SQLModel
-from datetime import datetime
+from datetime import date, datetime, timezone
+from . import order_ids
+from .events import EVENTS_CHANNEL, Event
 
 class UserBase(SQLModel):
     email: str = Field(index=True, unique=True)
@@ -13,7 +18,47 @@ class User(UserBase, table=True):
     hashed_password: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+# Changes to these User flags must reach every process that caches users
+# (auth.get_current_user). The listeners live with the model so that any
+# process changing a user through the ORM announces it, including scripts
+# such as create_admin.py that never import auth: the change is sent as a
+# NOTIFY in the same transaction, and every API process listening on
+# EVENTS_CHANNEL (EVENTS_BROKER=postgres) drops its copy.
+USER_CHANGED_EVENT = "user.changed"
+# Called with the email in this process: when a flag is set, and again once
+# the change is committed
+user_changed_hooks: List[Callable[[str], None]] = []
+
+def _on_user_flag_set(target, value, oldvalue, initiator):
+    if value == oldvalue or not target.email:
+        return
+    for hook in user_changed_hooks:
+        hook(target.email)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_users", set()).add(target.email)
+
+event.listen(User.is_active, "set", _on_user_flag_set)
+event.listen(User.is_superuser, "set", _on_user_flag_set)
+
+@event.listens_for(Session, "before_commit")
+def _announce_user_changes(session):
+    # NOTIFY is delivered on commit, so other processes drop their copy
+    # once the change is visible to them
+    for email in session.info.get("changed_users", ()):
+        payload = Event(USER_CHANGED_EVENT, None, {"email": email}).to_json()
+        session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": EVENTS_CHANNEL, "payload": payload})
+
+@event.listens_for(Session, "after_commit")
+def _user_changes_committed(session):
+    # A request running before the commit can re-cache the old row, so
+    # the hooks run once more
+    for email in session.info.pop("changed_users", ()):
+        for hook in user_changed_hooks:
+            hook(email)
+
 class UserCreate(UserBase):
+    email: EmailStr
     password: str
 
 class UserRead(UserBase):
@@ -29,13 +74,12 @@ class Token(SQLModel):
     access_token: str
     token_type: str
 
-import random
-import string
-
-def generate_order_id():
-    letters = "".join(random.choices(string.ascii_uppercase, k=2))
-    numbers = "".join(random.choices(string.digits, k=4))
-    return f"{letters}{numbers}"
+def as_naive_utc(value: datetime) -> datetime:
+    # Timestamps are stored as naive UTC; asyncpg refuses aware values
+    # for TIMESTAMP WITHOUT TIME ZONE columns (the frontend sends "...Z")
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 class OrderBase(SQLModel):
     service: str
@@ -47,11 +91,43 @@ class OrderBase(SQLModel):
     items_count: int = 0
     status: str = "Pending"
 
+    @field_validator("pickup_date")
+    @classmethod
+    def pickup_date_as_naive_utc(cls, value: datetime) -> datetime:
+        return as_naive_utc(value)
+
 class Order(OrderBase, table=True):
-    id: Optional[str] = Field(default_factory=generate_order_id, primary_key=True)
+    # Listing indexes: each matches a keyset-paginated query ordered by
+    # (created_at, id), optionally after an equality filter. For existing
+    # databases run add_order_indexes.py (create_all skips existing tables).
+    __table_args__ = (
+        Index("ix_order_created_at_id", "created_at", "id"),
+        Index("ix_order_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_order_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_order_service_created_at_id", "service", "created_at", "id"),
+    )
+
+    # Assigned from the order_id_seq sequence just before INSERT
+    id: Optional[str] = Field(default=None, primary_key=True)
     user_id: Optional[int] = Field(default=None, foreign_key="user.id")
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+@event.listens_for(Order, "before_insert")
+def assign_order_id(mapper, connection, target):
+    if target.id is None:
+        target.id = order_ids.allocator.next_id(connection)
+
+class OrderVersion(SQLModel, table=True):
+    # Change counters behind the customer order endpoints' ETags, one
+    # "user:<id>" row per customer, bumped on every write
+    scope: str = Field(primary_key=True)
+    version: int = 0
+
+# The admin listing's change counter. Every order write touches it, so it
+# is a sequence rather than a row: nextval takes no lock that concurrent
+# writers would queue on.
+order_changes_seq = Sequence("order_changes_seq", metadata=SQLModel.metadata)
+
 class OrderCreate(OrderBase):
     pass
 
@@ -59,3 +135,39 @@ class OrderRead(OrderBase):
     id: str
     created_at: datetime
     user_id: int
+
+class OrderBulkStatusUpdate(SQLModel):
+    order_ids: List[str]
+    status: str
+
+class OrderBulkStatusResult(SQLModel):
+    updated: List[OrderRead]
+    not_found: List[str]
+
+class StatusCount(SQLModel):
+    status: str
+    orders: int
+
+class AnalyticsSummary(SQLModel):
+    orders: int
+    revenue: float
+    items: int
+    by_status: List[StatusCount]
+
+class DailyStat(SQLModel):
+    day: date
+    service: Optional[str] = None
+    orders: int
+    revenue: float
+    items: int
+
+class ServiceStat(SQLModel):
+    service: str
+    orders: int
+    revenue: float
+    items: int
+
+class SlotStat(SQLModel):
+    pickup_day: date
+    time_slot: str
+    orders: int
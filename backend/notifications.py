@@ -0,0 +1,299 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from email.message import EmailMessage
+from typing import List, Optional
+
+import aiosmtplib
+from dotenv import load_dotenv
+
+from .metrics import Counter, Gauge, Histogram
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+logger = logging.getLogger(__name__)
+
+# Outgoing mail, decoupled from request handling: handlers enqueue a message
+# and return at once; a few sender tasks, each holding one long-lived SMTP
+# connection, drain the queue in batches. A failed message is retried with
+# exponential backoff, and a full queue sheds new mail rather than slowing
+# the API down.
+
+MAIL_USERNAME = os.getenv("MAIL_USERNAME")
+MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
+MAIL_FROM = os.getenv("MAIL_FROM")
+MAIL_PORT = int(os.getenv("MAIL_PORT", 587))
+MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
+MAIL_STARTTLS = os.getenv("MAIL_STARTTLS", "true").lower() == "true"
+MAIL_SSL_TLS = os.getenv("MAIL_SSL_TLS", "false").lower() == "true"
+MAIL_VALIDATE_CERTS = os.getenv("MAIL_VALIDATE_CERTS", "true").lower() == "true"
+
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", 1000))
+NOTIFY_CONNECTIONS = int(os.getenv("NOTIFY_CONNECTIONS", 2))
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", 20))
+NOTIFY_BATCH_WAIT_MS = float(os.getenv("NOTIFY_BATCH_WAIT_MS", 100))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", 5))
+NOTIFY_RETRY_BASE_SECONDS = float(os.getenv("NOTIFY_RETRY_BASE_SECONDS", 2))
+NOTIFY_SMTP_TIMEOUT = float(os.getenv("NOTIFY_SMTP_TIMEOUT", 30))
+NOTIFY_DRAIN_SECONDS = float(os.getenv("NOTIFY_DRAIN_SECONDS", 10))
+
+QUEUE_DEPTH = Gauge("notifications_queue_depth", "Messages waiting to be sent")
+SENT = Counter("notifications_sent_total", "Messages accepted by the SMTP server")
+RETRIED = Counter("notifications_retried_total", "Send attempts that failed and were scheduled again")
+FAILED = Counter("notifications_failed_total", "Messages given up on after the last attempt")
+DROPPED = Counter("notifications_dropped_total", "Messages rejected because the queue was full or stopped")
+SEND_SECONDS = Histogram(
+    "notification_send_seconds",
+    "SMTP time to send one message on an open connection",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+DELIVERY_SECONDS = Histogram(
+    "notification_delivery_seconds",
+    "Time from enqueue until the SMTP server accepted the message",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+BATCH_SIZE = Histogram(
+    "notification_batch_size",
+    "Messages sent per batch on one connection",
+    buckets=(1, 2, 5, 10, 20, 50),
+)
+CONNECTS = Counter("notification_smtp_connects_total", "SMTP connections opened (including TLS and login)")
+
+
+class Notification:
+    # The MIME message is only built by the sender, keeping enqueue cheap
+    __slots__ = ("recipient", "subject", "html", "enqueued_at", "attempts")
+
+    def __init__(self, recipient: str, subject: str, html: str):
+        self.recipient = recipient
+        self.subject = subject
+        self.html = html
+        self.enqueued_at = time.perf_counter()
+        self.attempts = 0
+
+
+def build_message(recipient: str, subject: str, html: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = recipient
+    message["Subject"] = subject
+    message.set_content(html, subtype="html")
+    return message
+
+
+class Notifier:
+    """
+    Bounded mail queue served by `connections` sender tasks. Each sender
+    keeps its SMTP connection open between batches and reconnects only
+    when the server has dropped it, so the TCP/STARTTLS/AUTH cost is paid
+    once per connection instead of once per message.
+    """
+
+    def __init__(
+        self,
+        hostname: str = MAIL_SERVER,
+        port: int = MAIL_PORT,
+        username: Optional[str] = MAIL_USERNAME,
+        password: Optional[str] = MAIL_PASSWORD,
+        start_tls: bool = MAIL_STARTTLS,
+        use_tls: bool = MAIL_SSL_TLS,
+        connections: int = NOTIFY_CONNECTIONS,
+        max_queue: int = NOTIFY_QUEUE_SIZE,
+        batch_size: int = NOTIFY_BATCH_SIZE,
+        batch_wait_ms: float = NOTIFY_BATCH_WAIT_MS,
+        max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+        retry_base_seconds: float = NOTIFY_RETRY_BASE_SECONDS,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.start_tls = start_tls
+        self.use_tls = use_tls
+        self.connections = max(1, connections)
+        self.max_queue = max_queue
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = max(0.0, batch_wait_ms) / 1000.0
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_seconds = retry_base_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._senders: List[asyncio.Task] = []
+        self._retries: set = set()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._senders)
+
+    async def start(self):
+        if self._senders:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._senders = [asyncio.create_task(self._sender()) for _ in range(self.connections)]
+
+    async def stop(self, drain_seconds: float = NOTIFY_DRAIN_SECONDS):
+        if not self._senders:
+            return
+        # Give queued mail a chance to go out before shutting down
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_seconds)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping with %d messages unsent", self._queue.qsize())
+        if self._retries:
+            logger.warning("Stopping with %d messages awaiting retry", len(self._retries))
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        for task in self._senders:
+            task.cancel()
+        await asyncio.gather(*self._senders, return_exceptions=True)
+        self._senders = []
+        QUEUE_DEPTH.set(0)
+
+    def enqueue(self, recipient: str, subject: str, html: str) -> bool:
+        """
+        Queues a message without waiting. Returns False (and counts a drop)
+        when the notifier is not running or the queue is full.
+        """
+        if not self._senders:
+            DROPPED.inc()
+            logger.warning("Not running, dropping mail to %s", recipient)
+            return False
+        try:
+            self._queue.put_nowait(Notification(recipient, subject, html))
+        except asyncio.QueueFull:
+            DROPPED.inc()
+            logger.warning("Queue full, dropping mail to %s", recipient)
+            return False
+        QUEUE_DEPTH.set(self._queue.qsize())
+        return True
+
+    def _client(self) -> aiosmtplib.SMTP:
+        return aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            start_tls=self.start_tls,
+            use_tls=self.use_tls,
+            validate_certs=MAIL_VALIDATE_CERTS,
+            timeout=NOTIFY_SMTP_TIMEOUT,
+        )
+
+    async def _ensure_connected(self, client: aiosmtplib.SMTP):
+        if client.is_connected:
+            return
+        await client.connect()
+        if self.username:
+            try:
+                await client.login(self.username, self.password)
+            except BaseException:
+                # Otherwise the next attempt would find the socket open and
+                # send unauthenticated
+                client.close()
+                raise
+        CONNECTS.inc()
+
+    async def _collect(self) -> List[Notification]:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        QUEUE_DEPTH.set(self._queue.qsize())
+        return batch
+
+    async def _sender(self):
+        client = self._client()
+        try:
+            while True:
+                batch = await self._collect()
+                BATCH_SIZE.observe(len(batch))
+                for notification in batch:
+                    try:
+                        await self._send(client, notification)
+                    except Exception:
+                        # A sender that dies leaves the queue to grow unseen
+                        FAILED.inc()
+                        logger.exception("Unexpected error sending mail to %s", notification.recipient)
+                    finally:
+                        self._queue.task_done()
+        finally:
+            if client.is_connected:
+                try:
+                    await client.quit()
+                except (aiosmtplib.SMTPException, OSError):
+                    client.close()
+
+    async def _send(self, client: aiosmtplib.SMTP, notification: Notification):
+        notification.attempts += 1
+        try:
+            message = build_message(notification.recipient, notification.subject, notification.html)
+        except ValueError as e:
+            # Header injection (CR/LF in the address) and the like; no
+            # attempt would fare better
+            FAILED.inc()
+            logger.error("Cannot build mail to %r: %s", notification.recipient, e)
+            return
+        try:
+            try:
+                await self._ensure_connected(client)
+                start = time.perf_counter()
+                await client.send_message(message)
+            except aiosmtplib.SMTPServerDisconnected:
+                # Idle connections get closed by the server; one immediate
+                # reconnect does not count as a failed attempt
+                client.close()
+                await self._ensure_connected(client)
+                start = time.perf_counter()
+                await client.send_message(message)
+        except (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPResponseException) as e:
+            # The server answered, so the connection is still usable; only
+            # transient (4xx) rejections are worth another attempt
+            if isinstance(e, aiosmtplib.SMTPResponseException) and 400 <= e.code < 500:
+                self._retry_later(notification, e)
+            else:
+                FAILED.inc()
+                logger.error("Mail to %s rejected: %s", notification.recipient, e)
+            return
+        except (aiosmtplib.SMTPException, OSError) as e:
+            client.close()
+            self._retry_later(notification, e)
+            return
+        now = time.perf_counter()
+        SEND_SECONDS.observe(now - start)
+        DELIVERY_SECONDS.observe(now - notification.enqueued_at)
+        SENT.inc()
+
+    def _retry_later(self, notification: Notification, error: Exception):
+        recipient = notification.recipient
+        if notification.attempts >= self.max_attempts:
+            FAILED.inc()
+            logger.error("Giving up on mail to %s after %d attempts: %s", recipient, notification.attempts, error)
+            return
+        RETRIED.inc()
+        # Exponential backoff with jitter so retries from a server outage
+        # do not all land at the same moment
+        delay = self.retry_base_seconds * (2 ** (notification.attempts - 1)) * random.uniform(0.5, 1.5)
+        loop = asyncio.get_running_loop()
+        handle = None
+
+        def requeue():
+            self._retries.discard(handle)
+            try:
+                self._queue.put_nowait(notification)
+            except asyncio.QueueFull:
+                FAILED.inc()
+                logger.error("Queue full, giving up on mail to %s", recipient)
+                return
+            QUEUE_DEPTH.set(self._queue.qsize())
+
+        handle = loop.call_later(delay, requeue)
+        self._retries.add(handle)
+
+
+notifier = Notifier()
@@ -0,0 +1,114 @@
+import threading
+from collections import deque
+from typing import Optional
+
+from sqlalchemy import Sequence, select
+from sqlmodel import SQLModel
+
+# Order IDs: 8 characters of Crockford base32 (no I, L, O or U, so they read
+# back unambiguously over the phone), unique by construction. Each process
+# reserves blocks of numbers from a Postgres sequence (hi-lo): one nextval
+# per ORDER_ID_BLOCK_SIZE orders, and never a "does this ID exist?" query.
+# The number is then run through a fixed 40-bit permutation so consecutive
+# orders do not get guessable, consecutive IDs.
+#
+# Legacy IDs are 2 letters + 4 digits (6 characters), so they can never
+# collide with these; they are kept as they are. Existing databases need the
+# sequence created once: python -m backend.add_order_id_sequence
+
+# The sequence increments by the block size, so this must not change
+# without an ALTER SEQUENCE ... INCREMENT BY to match
+ORDER_ID_BLOCK_SIZE = 64
+ORDER_ID_LENGTH = 8
+
+CROCKFORD_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_BITS = 5 * ORDER_ID_LENGTH
+_MASK = (1 << _BITS) - 1
+# Two rounds of multiply + xorshift. Any odd multiplier is invertible
+# modulo 2**40, and a right shift by half the width undoes itself.
+_MULTIPLIERS = (0x5DEECE66D, 0xB5026F5AA9)
+_INVERSES = tuple(pow(m, -1, 1 << _BITS) for m in _MULTIPLIERS)
+_SHIFT = _BITS // 2
+
+order_id_seq = Sequence("order_id_seq", start=1, increment=ORDER_ID_BLOCK_SIZE, metadata=SQLModel.metadata)
+
+
+def _permute(value: int) -> int:
+    for multiplier in _MULTIPLIERS:
+        value = (value * multiplier) & _MASK
+        value ^= value >> _SHIFT
+    return value
+
+
+def _unpermute(value: int) -> int:
+    for inverse in reversed(_INVERSES):
+        value ^= value >> _SHIFT
+        value = (value * inverse) & _MASK
+    return value
+
+
+def encode_order_id(value: int) -> str:
+    if not 0 <= value <= _MASK:
+        raise ValueError(f"Order number {value} out of range")
+    value = _permute(value)
+    chars = []
+    for _ in range(ORDER_ID_LENGTH):
+        chars.append(CROCKFORD_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def decode_order_id(order_id: str) -> int:
+    # Crockford decoding is forgiving about case and look-alike characters
+    normalized = order_id.upper().replace("O", "0").replace("I", "1").replace("L", "1")
+    if len(normalized) != ORDER_ID_LENGTH:
+        raise ValueError(f"Not a sequence-backed order id: {order_id}")
+    value = 0
+    for char in normalized:
+        digit = CROCKFORD_ALPHABET.find(char)
+        if digit < 0:
+            raise ValueError(f"Not a sequence-backed order id: {order_id}")
+        value = (value << 5) | digit
+    return _unpermute(value)
+
+
+class HiLoAllocator:
+    """
+    Hands out numbers from blocks reserved with one nextval() each.
+    Thread- and task-safe; the lock is never held while the database is
+    queried, so a refill cannot block other coroutines on the same thread.
+    """
+
+    def __init__(self, sequence: Sequence = order_id_seq, block_size: int = ORDER_ID_BLOCK_SIZE):
+        self.sequence = sequence
+        self.block_size = block_size
+        self._blocks: deque = deque()
+        self._lock = threading.Lock()
+
+    def _take(self) -> Optional[int]:
+        with self._lock:
+            while self._blocks:
+                block = self._blocks[0]
+                if block[0] < block[1]:
+                    value = block[0]
+                    block[0] += 1
+                    return value
+                self._blocks.popleft()
+        return None
+
+    def next_value(self, connection) -> int:
+        while True:
+            value = self._take()
+            if value is not None:
+                return value
+            # Two callers may refill at once; both blocks are valid and
+            # the second one simply gets used next
+            start = connection.execute(select(self.sequence.next_value())).scalar_one()
+            with self._lock:
+                self._blocks.append([start, start + self.block_size])
+
+    def next_id(self, connection) -> str:
+        return encode_order_id(self.next_value(connection))
+
+
+allocator = HiLoAllocator()
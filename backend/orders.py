@@ -1,29 +1,152 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlmodel import Session, select
-from .database import get_session
-from .models import Order, OrderCreate, OrderRead, User
-from .auth import get_current_user
-from .emails import send_order_confirmation, send_status_update
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import text, tuple_, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .database import get_async_session
+from .models import Order, OrderBulkStatusResult, OrderBulkStatusUpdate, OrderCreate, OrderRead, OrderVersion, User, as_naive_utc, order_changes_seq
+from .auth import get_current_user, get_stream_user
+from .events import Event, broker, stream
+from .responses import FastJSONResponse, etag_matches, make_etag, not_modified
+from .emails import send_order_confirmation, send_status_digest, send_status_update
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Clients read the next page's cursor from this header (the body stays a
+# plain list); a missing header means the last page has been reached
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_BULK_ORDERS = 1000
+
+# List endpoints select exactly the OrderRead columns as tuples and encode
+# them directly; response_model stays for the OpenAPI schema only
+ORDER_READ_FIELDS = tuple(OrderRead.model_fields)
+ORDER_READ_COLUMNS = tuple(getattr(Order, field) for field in ORDER_READ_FIELDS)
+
+# Clients must revalidate, but may keep the body and send If-None-Match
+CACHE_CONTROL = "private, no-cache"
+GLOBAL_SCOPE = "all"
+
+def user_scope(user_id: int) -> str:
+    return f"user:{user_id}"
+
+async def get_order_version(session: AsyncSession, scope: str) -> int:
+    if scope == GLOBAL_SCOPE:
+        return (await session.execute(text(f"SELECT last_value FROM {order_changes_seq.name}"))).scalar_one()
+    statement = select(OrderVersion.version).where(OrderVersion.scope == scope)
+    return (await session.exec(statement)).first() or 0
+
+async def bump_order_versions(session: AsyncSession, user_ids: Iterable[int]):
+    """
+    Advances each given customer's counter and the global one in the
+    caller's transaction, invalidating the ETags of every listing that
+    could include the changed orders. Call before committing any write,
+    and call bump_global_version once it has committed.
+    """
+    scopes = sorted({user_scope(user_id) for user_id in user_ids if user_id is not None})
+    if scopes:
+        statement = insert(OrderVersion).values([{"scope": scope, "version": 1} for scope in scopes])
+        statement = statement.on_conflict_do_update(
+            index_elements=[OrderVersion.scope],
+            set_={"version": OrderVersion.version + 1},
+        )
+        await session.execute(statement)
+    await bump_global_version(session)
+
+async def bump_global_version(session: AsyncSession):
+    # nextval is not transactional: bumped only before commit, a listing
+    # read in between would pair the old rows with the new version. The
+    # second bump, after commit, retires that pairing.
+    await session.execute(select(order_changes_seq.next_value()))
+
+def listing_etag(request: Request, scope: str, version: int) -> str:
+    # Query parameters pick the page, so they are part of the tag
+    query = hashlib.sha1(str(request.query_params).encode()).hexdigest()[:8]
+    return make_etag(scope, version, query)
+
+async def publish_order_events(event_type: str, orders: Iterable[Order]):
+    # Called after commit, so subscribers never see uncommitted changes;
+    # the broker logs rather than raises, as the write has already happened
+    events = [
+        Event(event_type, order.user_id, OrderRead.model_validate(order).model_dump(mode="json"))
+        for order in orders
+    ]
+    await broker.publish_many(events)
+
+def encode_cursor(created_at: datetime, order_id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), order_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(padded))
+        return as_naive_utc(datetime.fromisoformat(created_at)), str(order_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def paginate_orders(
+    session: AsyncSession,
+    etag: str,
+    statement,
+    limit: int,
+    cursor: Optional[str],
+    status_filter: Optional[str] = None,
+    service: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+) -> FastJSONResponse:
+    """
+    Applies the listing filters and one page of keyset pagination on
+    (created_at, id), newest first. Each page is a range scan on one of the
+    (..., created_at, id) indexes instead of an OFFSET that re-reads every
+    earlier row. `statement` must select ORDER_READ_COLUMNS.
+    """
+    if status_filter is not None:
+        statement = statement.where(Order.status == status_filter)
+    if service is not None:
+        statement = statement.where(Order.service == service)
+    if created_after is not None:
+        statement = statement.where(Order.created_at >= as_naive_utc(created_after))
+    if created_before is not None:
+        statement = statement.where(Order.created_at < as_naive_utc(created_before))
+    if cursor:
+        statement = statement.where(tuple_(Order.created_at, Order.id) < decode_cursor(cursor))
+
+    # One extra row tells us whether there is a next page
+    statement = statement.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1)
+    rows = (await session.execute(statement)).all()
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = dict(zip(ORDER_READ_FIELDS, rows[-1]))
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(last["created_at"], last["id"])
+    return FastJSONResponse([dict(zip(ORDER_READ_FIELDS, row)) for row in rows], headers=headers)
+
 @router.post("/", response_model=OrderRead)
-def create_order(
+async def create_order(
     order: OrderCreate, 
-    background_tasks: BackgroundTasks,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
     db_order = Order.from_orm(order)
     db_order.user_id = current_user.id
     session.add(db_order)
-    session.commit()
-    session.refresh(db_order)
+    await bump_order_versions(session, [current_user.id])
+    await session.commit()
+    await bump_global_version(session)
+    await session.refresh(db_order)
+    await publish_order_events("order.created", [db_order])
     
-    # Send confirmation email
-    background_tasks.add_task(
-        send_order_confirmation, 
+    # Send confirmation email (queued; delivered by the notifier)
+    send_order_confirmation(
         current_user.email, 
         db_order.id, 
         db_order.pickup_date.strftime("%Y-%m-%d")
@@ -32,67 +155,170 @@ def create_order(
     return db_order
 
 @router.get("/", response_model=List[OrderRead])
-def read_orders(
-    session: Session = Depends(get_session),
+async def read_orders(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    service: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
-    statement = select(Order).where(Order.user_id == current_user.id).order_by(Order.created_at.desc())
-    orders = session.exec(statement).all()
-    return orders
+    scope = user_scope(current_user.id)
+    etag = listing_etag(request, scope, await get_order_version(session, scope))
+    if etag_matches(request, etag):
+        return not_modified(etag, {"Cache-Control": CACHE_CONTROL})
+
+    statement = select(*ORDER_READ_COLUMNS).where(Order.user_id == current_user.id)
+    return await paginate_orders(
+        session, etag, statement, limit, cursor,
+        status, service, created_after, created_before,
+    )
+
+# Declared before /{order_id} so "events" is not taken for an order id
+@router.get("/events")
+async def order_events(
+    last_event_id: Optional[str] = Header(None),
+    current_user: User = Depends(get_stream_user)
+):
+    """
+    Server-Sent Events stream of order.created / order.updated events: the
+    customer's own orders, or every order for staff. Reconnecting with
+    Last-Event-ID replays what was missed; a "reset" event means the gap
+    was too long and the client should reload its orders.
+    """
+    user_id = None if current_user.is_superuser else current_user.id
+    return StreamingResponse(
+        stream(user_id, last_event_id),
+        media_type="text/event-stream",
+        # Keep proxies (nginx) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.get("/{order_id}", response_model=OrderRead)
-def read_order(
+async def read_order(
     order_id: str, 
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
-    order = session.get(Order, order_id)
+    # The customer's counter covers all of their orders, so an unchanged
+    # order is answered without loading it
+    scope = user_scope(current_user.id)
+    etag = make_etag(scope, await get_order_version(session, scope), order_id)
+    if etag_matches(request, etag):
+        return not_modified(etag, {"Cache-Control": CACHE_CONTROL})
+
+    order = await session.get(Order, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     if order.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to view this order")
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
     return order
 
 @router.get("/admin/all", response_model=List[OrderRead])
-def read_all_orders(
-    session: Session = Depends(get_session),
+async def read_all_orders(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    service: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
     if not current_user.is_superuser:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    statement = select(Order).order_by(Order.created_at.desc())
-    orders = session.exec(statement).all()
-    return orders
+    etag = listing_etag(request, GLOBAL_SCOPE, await get_order_version(session, GLOBAL_SCOPE))
+    if etag_matches(request, etag):
+        return not_modified(etag, {"Cache-Control": CACHE_CONTROL})
+
+    return await paginate_orders(
+        session, etag, select(*ORDER_READ_COLUMNS), limit, cursor,
+        status, service, created_after, created_before,
+    )
+
+# Declared before /{order_id}/status so "admin" is not taken for an order id
+@router.patch("/admin/status", response_model=OrderBulkStatusResult)
+async def bulk_update_order_status(
+    update_request: OrderBulkStatusUpdate,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Moves many orders to one status in a single statement and sends each
+    affected customer one email covering all of their orders.
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    order_ids = list(dict.fromkeys(update_request.order_ids))
+    if len(order_ids) > MAX_BULK_ORDERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_ORDERS} orders per request")
+    if not order_ids:
+        return OrderBulkStatusResult(updated=[], not_found=[])
+
+    statement = (
+        update(Order)
+        .where(Order.id.in_(order_ids))
+        .values(status=update_request.status)
+        .returning(Order)
+        .execution_options(synchronize_session=False)
+    )
+    updated = (await session.execute(statement)).scalars().all()
+    if updated:
+        await bump_order_versions(session, {order.user_id for order in updated})
+    await session.commit()
+    if updated:
+        await bump_global_version(session)
+
+    orders_by_user = {}
+    for order in updated:
+        orders_by_user.setdefault(order.user_id, []).append(order.id)
+    users = (await session.exec(select(User.id, User.email).where(User.id.in_(orders_by_user)))).all()
+    for user_id, email in users:
+        send_status_digest(email, orders_by_user[user_id], update_request.status)
+
+    await publish_order_events("order.updated", updated)
+
+    found = {order.id for order in updated}
+    return OrderBulkStatusResult(
+        updated=updated,
+        not_found=[order_id for order_id in order_ids if order_id not in found],
+    )
 
 @router.patch("/{order_id}/status", response_model=OrderRead)
-def update_order_status(
+async def update_order_status(
     order_id: str,
     status: str,
-    background_tasks: BackgroundTasks,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
     if not current_user.is_superuser:
         raise HTTPException(status_code=403, detail="Not authorized")
         
-    order = session.get(Order, order_id)
+    order = await session.get(Order, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
         
     order.status = status
     session.add(order)
-    session.commit()
-    session.refresh(order)
+    await bump_order_versions(session, [order.user_id])
+    await session.commit()
+    await bump_global_version(session)
+    await session.refresh(order)
+    await publish_order_events("order.updated", [order])
     
     # Get user email
-    user = session.get(User, order.user_id)
+    user = await session.get(User, order.user_id)
     if user:
-         background_tasks.add_task(
-            send_status_update, 
-            user.email, 
-            order.id, 
-            status
-        )
+        send_status_update(user.email, order.id, status)
     
     return order
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from .metrics import Counter, Gauge, Histogram
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+# Argon2 is slow and memory-hard on purpose (ARGON2_MEMORY_COST KiB per
+# hash), so it never runs on the event loop: hashes and verifications go
+# to a small dedicated thread pool (argon2-cffi releases the GIL), and at
+# most PASSWORD_HASH_CONCURRENCY run at once. That bounds both CPU and
+# memory during a login burst; requests that cannot get a slot within
+# PASSWORD_HASH_QUEUE_TIMEOUT seconds get a 503 instead of piling up.
+
+# Defaults match passlib's, so existing hashes are not needlessly rehashed
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 4))
+PASSWORD_HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", 2))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", 5))
+
+# Hashes made with other parameters still verify, and verify_password
+# hands back an upgraded hash for them
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
+
+HASH_SECONDS = Histogram(
+    "password_hash_seconds",
+    "Time spent computing Argon2 hashes",
+    ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+QUEUE_WAIT = Histogram(
+    "password_hash_queue_wait_seconds",
+    "Time spent waiting for a free hashing slot",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+IN_FLIGHT = Gauge("password_hash_in_flight", "Argon2 operations currently running")
+REJECTED = Counter("password_hash_rejected_total", "Hash requests turned away after waiting too long for a slot")
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="argon2")
+_slots = asyncio.Semaphore(PASSWORD_HASH_CONCURRENCY)
+
+
+async def _run(operation: str, func, *args):
+    waited = time.perf_counter()
+    try:
+        await asyncio.wait_for(_slots.acquire(), timeout=PASSWORD_HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        REJECTED.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Too many sign-ins in progress, please retry",
+            headers={"Retry-After": "1"},
+        )
+    QUEUE_WAIT.observe(time.perf_counter() - waited)
+
+    IN_FLIGHT.inc()
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        HASH_SECONDS.observe(time.perf_counter() - start, operation=operation)
+        IN_FLIGHT.dec()
+        _slots.release()
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", pwd_context.hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Checks a password against its stored hash. Returns (valid, new_hash);
+    new_hash is set when the stored hash used outdated parameters and
+    should be replaced.
+    """
+    return await _run("verify", pwd_context.verify_and_update, password, hashed_password)
@@ -4,7 +4,8 @@ from backend.database import engine
 
 def reset_orders_table():
     with engine.connect() as conn:
-        conn.execute(text('DROP TABLE IF EXISTS "order";'))
+        # CASCADE also drops the analytics rollup view; startup recreates it
+        conn.execute(text('DROP TABLE IF EXISTS "order" CASCADE;'))
         conn.commit()
     
     SQLModel.metadata.create_all(engine)
@@ -0,0 +1,92 @@
+import gc
+import glob
+import logging
+import os
+
+from dotenv import load_dotenv
+from uvicorn_worker import UvicornWorker
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+logger = logging.getLogger(__name__)
+
+# Pieces of the pre-fork production server (see gunicorn_conf.py). The
+# master imports the app and loads the model once; workers are forked from
+# it and share those pages copy-on-write, then replace whatever cannot
+# cross a fork: database pools, the logging thread and thread caps. Each
+# worker's metrics go to a shared directory that /metrics merges.
+
+# Seconds a stopping worker lets in-flight requests finish; gunicorn kills
+# it at GRACEFUL_TIMEOUT, so open event streams are cut a little before
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+
+
+class ServingWorker(UvicornWorker):
+    """
+    uvicorn's gunicorn worker, but it stops waiting for open connections
+    shortly before gunicorn would kill it. A recycled worker otherwise
+    lingers until its last event stream closes, and gunicorn only forks its
+    replacement once it has exited. Clients resume streams with
+    Last-Event-ID.
+    """
+
+    CONFIG_KWARGS = {
+        **UvicornWorker.CONFIG_KWARGS,
+        "timeout_graceful_shutdown": max(1, GRACEFUL_TIMEOUT - 5),
+    }
+
+
+def on_starting(server):
+    """
+    Runs in the master before any worker is forked: creates the schema
+    once, rather than in every worker at the same moment (concurrent
+    CREATEs on a fresh database can fail, and a worker failing to boot
+    stops gunicorn).
+    """
+    from .analytics import create_rollup_view
+    from .database import create_db_and_tables, engine
+    from .metrics import METRICS_DIR
+    create_db_and_tables()
+    create_rollup_view()
+    # Workers open their own connections
+    engine.dispose()
+    # Snapshots left by an earlier run would be merged into this one's
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        os.remove(path)
+
+
+def when_ready(server):
+    """
+    Runs in the master once the app is imported, before any worker is
+    forked: loads the model there, then moves everything allocated so far
+    out of the garbage collector's reach, so collections in the workers do
+    not write to (and so copy) the shared pages. What the master has
+    counted so far (schema creation, warm-up) goes to the metrics archive,
+    since workers start their counts from zero.
+    """
+    from .metrics import archive_pre_fork
+    if not server.cfg.preload_app:
+        archive_pre_fork()
+        return
+    from .ai_service import preload_for_fork
+    if preload_for_fork():
+        logger.info("Model loaded in the master; workers share it")
+    archive_pre_fork()
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Runs in each new worker, before it starts serving."""
+    from .database import reset_after_fork as reset_database
+    from .log_config import reset_after_fork as reset_logging
+    from .metrics import share_across_processes
+    reset_logging()
+    reset_database()
+    share_across_processes()
+
+
+def child_exit(server, worker):
+    """Runs in the master once a worker has exited."""
+    from .metrics import archive_process
+    archive_process(worker.pid)
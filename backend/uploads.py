@@ -0,0 +1,115 @@
+import json
+from typing import Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+
+# Upload handling for the AI endpoints: hard byte limits enforced while the
+# body is still streaming in, and content sniffing on the first bytes so
+# non-images are turned away before they are buffered or decoded.
+
+CHUNK_SIZE = 64 * 1024
+# Room for multipart boundaries and part headers on top of the file limit
+MULTIPART_OVERHEAD = 64 * 1024
+
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+ZIP_SIGNATURE = b"PK\x03\x04"
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    for signature, kind in _SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+async def read_upload(file: UploadFile, max_bytes: int, allow_zip: bool = False) -> bytes:
+    """
+    Reads an upload in chunks, failing with 415 as soon as the first chunk
+    shows it is not an image (or zip, if allowed) and with 413 as soon as
+    it grows past `max_bytes`.
+    """
+    head = await file.read(CHUNK_SIZE)
+    if sniff_image_type(head) is None and not (allow_zip and head.startswith(ZIP_SIGNATURE)):
+        raise HTTPException(status_code=415, detail=f"{file.filename or 'Upload'} is not a supported image")
+
+    buffer = bytearray(head)
+    while len(buffer) <= max_bytes:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            return bytes(buffer)
+        buffer += chunk
+    raise HTTPException(status_code=413, detail=f"Upload too large (limit {max_bytes} bytes)")
+
+
+class _BodyTooLarge(HTTPException):
+    # An HTTPException so FastAPI's body parsing passes it through as a 413
+    # instead of reporting a generic parse error
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"Upload too large (limit {limit} bytes)")
+
+
+class UploadLimitMiddleware:
+    """
+    Rejects request bodies over a per-path limit with 413 before they are
+    parsed. A declared Content-Length is checked up front; chunked bodies
+    are counted as they arrive and cut off at the limit, so an oversized
+    upload never ends up spooled in memory or on disk.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _BodyTooLarge(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send, limit: int):
+        body = json.dumps({"detail": f"Upload too large (limit {limit} bytes)"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import time
+
+import aiosmtplib
+from aiosmtpd.controller import Controller
+
+from .notifications import FAILED, RETRIED, SENT, Notifier, build_message
+
+# Checks the notifier against a local SMTP stand-in (pip install aiosmtpd):
+# every message arrives, transient 451 rejections are retried, all mail
+# goes over NOTIFY_CONNECTIONS connections, and the pooled sender is
+# compared with the old one-connection-per-message approach.
+#
+#   python -m backend.verify_notifications
+#   python -m backend.verify_notifications --messages 500 --handshake-ms 50
+
+HOST = "127.0.0.1"
+PORT = 8025
+
+
+class RecordingHandler:
+    def __init__(self, handshake_delay: float, reject_every: int):
+        self.handshake_delay = handshake_delay
+        self.reject_every = reject_every
+        self.received = set()
+        self.peers = set()
+        self.rejected = set()
+        self.seen = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        # Stands in for TCP + STARTTLS + AUTH round trips to a real server
+        await asyncio.sleep(self.handshake_delay)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        subject = envelope.content.decode(errors="replace").split("Subject: ", 1)[1].split("\r\n", 1)[0]
+        self.seen += 1
+        if self.reject_every and self.seen % self.reject_every == 0 and subject not in self.rejected:
+            self.rejected.add(subject)
+            return "451 Try again later"
+        self.received.add(subject)
+        self.peers.add(session.peer)
+        return "250 OK"
+
+
+async def send_one_per_connection(count: int) -> float:
+    start = time.perf_counter()
+    for i in range(count):
+        message = build_message("customer@example.com", f"baseline-{i}", "<p>hi</p>")
+        await aiosmtplib.send(message, hostname=HOST, port=PORT, start_tls=False, use_tls=False)
+    return time.perf_counter() - start
+
+
+async def send_pooled(count: int, connections: int, batch_size: int) -> float:
+    notifier = Notifier(
+        hostname=HOST, port=PORT, username=None, password=None, start_tls=False, use_tls=False,
+        connections=connections, batch_size=batch_size, retry_base_seconds=0.05,
+    )
+    await notifier.start()
+    start = time.perf_counter()
+    for i in range(count):
+        assert notifier.enqueue("customer@example.com", f"pooled-{i}", "<p>hi</p>")
+    enqueued = time.perf_counter() - start
+    print(f"Enqueued {count} messages in {enqueued * 1000:.1f} ms")
+    # Retries are scheduled outside the queue, so wait on the counters
+    while SENT.value() + FAILED.value() < count:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    await notifier.stop()
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Verify the notifier against a local SMTP server")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--connections", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--handshake-ms", type=float, default=20, help="simulated connect/TLS/auth cost")
+    parser.add_argument("--reject-every", type=int, default=25, help="answer every Nth DATA with a 451 once")
+    args = parser.parse_args()
+
+    handler = RecordingHandler(args.handshake_ms / 1000.0, 0)
+    controller = Controller(handler, hostname=HOST, port=PORT)
+    controller.start()
+    try:
+        baseline = await send_one_per_connection(args.messages)
+        baseline_peers = len(handler.peers)
+
+        handler.peers.clear()
+        handler.reject_every = args.reject_every
+        pooled = await send_pooled(args.messages, args.connections, args.batch_size)
+    finally:
+        controller.stop()
+
+    delivered = len([s for s in handler.received if s.startswith("pooled-")])
+    print(f"one connection per message: {args.messages / baseline:8.1f} msg/s over {baseline_peers} connections")
+    print(f"pooled notifier:            {args.messages / pooled:8.1f} msg/s over {len(handler.peers)} connections")
+    print(f"retried {int(RETRIED.value())}, failed {int(FAILED.value())}, delivered {delivered}/{args.messages}")
+
+    if delivered != args.messages or len(handler.peers) > args.connections:
+        raise SystemExit("FAILURE: messages lost or connections not reused")
+    print("SUCCESS")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -37,12 +37,30 @@ export const auth = {
     },
 };
 
+// Order listings come a page at a time: each page's X-Next-Cursor header
+// points at the next one and is missing on the last
+const PAGE_SIZE = 200;
+
+const fetchAllPages = async (url: string, params: Record<string, any> = {}) => {
+    const items: any[] = [];
+    let cursor: string | undefined;
+    do {
+        const response = await api.get(url, { params: { ...params, limit: PAGE_SIZE, cursor } });
+        items.push(...response.data);
+        cursor = response.headers['x-next-cursor'];
+    } while (cursor);
+    return items;
+};
+
 export const orders = {
     create: async (data: any) => {
         return api.post('/orders/', data);
     },
-    list: async () => {
-        return api.get('/orders/');
+    list: async (params?: { limit?: number; cursor?: string; status?: string; service?: string }) => {
+        return api.get('/orders/', { params });
+    },
+    listAll: async (params?: { status?: string; service?: string }) => {
+        return fetchAllPages('/orders/', params);
     },
     get: async (id: string) => {
         return api.get(`/orders/${id}`);
@@ -50,8 +68,26 @@ export const orders = {
     updateStatus: async (id: string, status: string) => {
         return api.patch(`/orders/${id}/status`, null, { params: { status } });
     },
-    getAll: async () => {
-        return api.get('/orders/admin/all');
+    getAll: async (params?: { limit?: number; cursor?: string; status?: string; service?: string }) => {
+        return api.get('/orders/admin/all', { params });
+    },
+    getAllPages: async (params?: { status?: string; service?: string }) => {
+        return fetchAllPages('/orders/admin/all', params);
+    },
+};
+
+export const analytics = {
+    summary: async (params?: { start?: string; end?: string }) => {
+        return api.get('/analytics/summary', { params });
+    },
+    daily: async (params?: { start?: string; end?: string; service?: string; by_service?: boolean }) => {
+        return api.get('/analytics/daily', { params });
+    },
+    services: async (params?: { start?: string; end?: string }) => {
+        return api.get('/analytics/services', { params });
+    },
+    pickupSlots: async (params?: { start?: string; end?: string }) => {
+        return api.get('/analytics/pickup-slots', { params });
     },
 };
 
@@ -33,8 +33,7 @@ const History = () => {
 
   const loadOrders = async () => {
     try {
-      const response = await apiOrders.list();
-      setOrders(response.data);
+      setOrders(await apiOrders.listAll());
     } catch (error) {
       console.error(error);
       toast.error("Failed to load order history");
@@ -43,8 +43,7 @@ const AdminDashboard = () => {
 
     const loadOrders = async () => {
         try {
-            const response = await apiOrders.getAll();
-            setOrders(response.data);
+            setOrders(await apiOrders.getAllPages());
         } catch (error) {
             console.error(error);
             toast.error("Failed to load admin orders");
@@ -1,6 +1,10 @@
+import { useEffect, useState } from "react";
 import { Card } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
-import { Download, TrendingUp, Users, DollarSign, Package } from "lucide-react";
+import { Download, TrendingUp, Shirt, DollarSign, Package, Loader2 } from "lucide-react";
+import { differenceInCalendarDays, format, parseISO, startOfMonth, subDays, subMonths } from "date-fns";
+import { toast } from "sonner";
+import { analytics as apiAnalytics } from "@/lib/api";
 import {
   LineChart,
   Line,
@@ -19,35 +23,147 @@ import {
   ResponsiveContainer,
 } from "recharts";
 
+interface Summary {
+  orders: number;
+  revenue: number;
+  items: number;
+}
+
+interface DailyStat {
+  day: string;
+  orders: number;
+  revenue: number;
+  items: number;
+}
+
+interface ServiceStat {
+  service: string;
+  orders: number;
+  revenue: number;
+  items: number;
+}
+
+interface SlotStat {
+  pickup_day: string;
+  time_slot: string;
+  orders: number;
+}
+
+const WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"];
+
+const isoDate = (value: Date) => format(value, "yyyy-MM-dd");
+
+const formatMoney = (value: number) =>
+  `$${value.toLocaleString(undefined, { minimumFractionDigits: 2, maximumFractionDigits: 2 })}`;
+
+// Percentage change against the previous period of the same length
+const change = (current: number, previous: number) => {
+  if (!previous) return null;
+  return Math.round(((current - previous) / previous) * 100);
+};
+
+const ChangeLabel = ({ current, previous }: { current: number; previous: number }) => {
+  const pct = change(current, previous);
+  if (pct === null) return <div className="text-sm text-muted-foreground">No data for the previous period</div>;
+  return (
+    <div className={`text-sm ${pct >= 0 ? "text-secondary" : "text-destructive"}`}>
+      {pct >= 0 ? "+" : ""}
+      {pct}% from last period
+    </div>
+  );
+};
+
 const Analytics = () => {
-  const revenueData = [
-    { month: "Jul", revenue: 35000, orders: 890, customers: 245 },
-    { month: "Aug", revenue: 42000, orders: 1050, customers: 298 },
-    { month: "Sep", revenue: 38000, orders: 945, customers: 267 },
-    { month: "Oct", revenue: 47000, orders: 1180, customers: 332 },
-    { month: "Nov", revenue: 52000, orders: 1310, customers: 378 },
-    { month: "Dec", revenue: 58000, orders: 1450, customers: 421 },
-  ];
-
-  const customerBehavior = [
-    { day: "Mon", orders: 145 },
-    { day: "Tue", orders: 167 },
-    { day: "Wed", orders: 178 },
-    { day: "Thu", orders: 189 },
-    { day: "Fri", orders: 234 },
-    { day: "Sat", orders: 312 },
-    { day: "Sun", orders: 289 },
-  ];
-
-  const serviceDistribution = [
-    { name: "Wash & Fold", value: 1245, revenue: 18675 },
-    { name: "Dry Cleaning", value: 678, revenue: 30420 },
-    { name: "Ironing", value: 456, revenue: 6840 },
-    { name: "Special Care", value: 234, revenue: 11700 },
-  ];
+  const [loading, setLoading] = useState(true);
+  const [summary, setSummary] = useState<Summary>({ orders: 0, revenue: 0, items: 0 });
+  const [previousSummary, setPreviousSummary] = useState<Summary>({ orders: 0, revenue: 0, items: 0 });
+  const [daily, setDaily] = useState<DailyStat[]>([]);
+  const [services, setServices] = useState<ServiceStat[]>([]);
+  const [previousServices, setPreviousServices] = useState<ServiceStat[]>([]);
+  const [slots, setSlots] = useState<SlotStat[]>([]);
+  useEffect(() => {
+    loadAnalytics();
+  }, []);
+
+  const loadAnalytics = async () => {
+    // The last six calendar months, compared with the six before them
+    const today = new Date();
+    const start = startOfMonth(subMonths(today, 5));
+    const previousEnd = subDays(start, 1);
+    const previousStart = subDays(start, differenceInCalendarDays(today, start) + 1);
+    const range = { start: isoDate(start), end: isoDate(today) };
+    const previousRange = { start: isoDate(previousStart), end: isoDate(previousEnd) };
+    try {
+      const [current, previous, days, byService, previousByService, pickups] = await Promise.all([
+        apiAnalytics.summary(range),
+        apiAnalytics.summary(previousRange),
+        apiAnalytics.daily(range),
+        apiAnalytics.services(range),
+        apiAnalytics.services(previousRange),
+        apiAnalytics.pickupSlots(range),
+      ]);
+      setSummary(current.data);
+      setPreviousSummary(previous.data);
+      setDaily(days.data);
+      setServices(byService.data);
+      setPreviousServices(previousByService.data);
+      setSlots(pickups.data);
+    } catch (error) {
+      console.error(error);
+      toast.error("Failed to load analytics");
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const monthly = new Map<string, { month: string; revenue: number; orders: number }>();
+  for (const stat of daily) {
+    const day = parseISO(stat.day);
+    const key = format(day, "yyyy-MM");
+    const entry = monthly.get(key) ?? { month: format(day, "MMM"), revenue: 0, orders: 0 };
+    entry.revenue += stat.revenue;
+    entry.orders += stat.orders;
+    monthly.set(key, entry);
+  }
+  const revenueData = [...monthly.entries()].sort(([a], [b]) => a.localeCompare(b)).map(([, entry]) => entry);
+
+  const customerBehavior = WEEKDAYS.map((day) => ({ day, orders: 0 }));
+  for (const stat of daily) {
+    // getDay() counts from Sunday; the chart starts on Monday
+    customerBehavior[(parseISO(stat.day).getDay() + 6) % 7].orders += stat.orders;
+  }
+  const serviceDistribution = services.map((stat) => ({
+    name: stat.service,
+    value: stat.orders,
+    revenue: stat.revenue,
+    growth: change(stat.revenue, previousServices.find((previous) => previous.service === stat.service)?.revenue ?? 0),
+  }));
+
+  const slotTotals = new Map<string, number>();
+  for (const stat of slots) {
+    slotTotals.set(stat.time_slot, (slotTotals.get(stat.time_slot) ?? 0) + stat.orders);
+  }
+  const busiestSlot = [...slotTotals.entries()].sort(([, a], [, b]) => b - a)[0];
+
+  const averageOrderValue = summary.orders ? summary.revenue / summary.orders : 0;
+  const previousAverageOrderValue = previousSummary.orders ? previousSummary.revenue / previousSummary.orders : 0;
+
+  const busiestDay = customerBehavior.reduce((best, day) => (day.orders > best.orders ? day : best));
+  const topService = serviceDistribution.reduce<(typeof serviceDistribution)[number] | null>(
+    (best, service) => (!best || service.revenue > best.revenue ? service : best),
+    null
+  );
 
   const COLORS = ["hsl(var(--primary))", "hsl(var(--secondary))", "hsl(var(--accent))", "hsl(var(--muted))"];
 
+  if (loading) {
+    return (
+      <div className="flex items-center justify-center h-64">
+        <Loader2 className="h-8 w-8 animate-spin text-primary" />
+      </div>
+    );
+  }
+
   return (
     <div className="space-y-6 animate-fade-in">
       <div className="flex items-center justify-between">
@@ -68,32 +184,32 @@ const Analytics = () => {
             <div className="text-sm text-muted-foreground">Total Revenue</div>
             <DollarSign className="h-5 w-5 text-primary" />
           </div>
-          <div className="text-3xl font-bold mb-1">$272k</div>
-          <div className="text-sm text-secondary">+22% from last period</div>
+          <div className="text-3xl font-bold mb-1">{formatMoney(summary.revenue)}</div>
+          <ChangeLabel current={summary.revenue} previous={previousSummary.revenue} />
         </Card>
         <Card className="p-6 shadow-soft">
           <div className="flex items-center justify-between mb-2">
             <div className="text-sm text-muted-foreground">Total Orders</div>
             <Package className="h-5 w-5 text-primary" />
           </div>
-          <div className="text-3xl font-bold mb-1">6,834</div>
-          <div className="text-sm text-secondary">+18% from last period</div>
+          <div className="text-3xl font-bold mb-1">{summary.orders.toLocaleString()}</div>
+          <ChangeLabel current={summary.orders} previous={previousSummary.orders} />
         </Card>
         <Card className="p-6 shadow-soft">
           <div className="flex items-center justify-between mb-2">
-            <div className="text-sm text-muted-foreground">Active Customers</div>
-            <Users className="h-5 w-5 text-primary" />
+            <div className="text-sm text-muted-foreground">Items Processed</div>
+            <Shirt className="h-5 w-5 text-primary" />
           </div>
-          <div className="text-3xl font-bold mb-1">1,941</div>
-          <div className="text-sm text-secondary">+15% from last period</div>
+          <div className="text-3xl font-bold mb-1">{summary.items.toLocaleString()}</div>
+          <ChangeLabel current={summary.items} previous={previousSummary.items} />
         </Card>
         <Card className="p-6 shadow-soft">
           <div className="flex items-center justify-between mb-2">
             <div className="text-sm text-muted-foreground">Avg Order Value</div>
             <TrendingUp className="h-5 w-5 text-primary" />
           </div>
-          <div className="text-3xl font-bold mb-1">$39.80</div>
-          <div className="text-sm text-secondary">+8% from last period</div>
+          <div className="text-3xl font-bold mb-1">{formatMoney(averageOrderValue)}</div>
+          <ChangeLabel current={averageOrderValue} previous={previousAverageOrderValue} />
         </Card>
       </div>
 
@@ -194,13 +310,17 @@ const Analytics = () => {
                   <td className="py-3 px-4 font-medium">{service.name}</td>
                   <td className="text-right py-3 px-4">{service.value.toLocaleString()}</td>
                   <td className="text-right py-3 px-4 font-semibold">
-                    ${service.revenue.toLocaleString()}
+                    {formatMoney(service.revenue)}
                   </td>
                   <td className="text-right py-3 px-4">
-                    ${(service.revenue / service.value).toFixed(2)}
+                    {formatMoney(service.value ? service.revenue / service.value : 0)}
                   </td>
-                  <td className="text-right py-3 px-4 text-secondary">
-                    +{Math.floor(Math.random() * 20 + 5)}%
+                  <td
+                    className={`text-right py-3 px-4 ${
+                      service.growth !== null && service.growth < 0 ? "text-destructive" : "text-secondary"
+                    }`}
+                  >
+                    {service.growth === null ? "—" : `${service.growth >= 0 ? "+" : ""}${service.growth}%`}
                   </td>
                 </tr>
               ))}
@@ -211,13 +331,22 @@ const Analytics = () => {
 
       {/* AI Insights */}
       <Card className="p-6 shadow-soft bg-gradient-primary text-primary-foreground">
-        <h3 className="text-xl font-bold mb-4">AI-Generated Insights</h3>
+        <h3 className="text-xl font-bold mb-4">Insights</h3>
         <div className="space-y-3 opacity-95">
-          <p>• Weekend orders are 35% higher - consider additional staffing on Fri-Sun</p>
-          <p>• Dry cleaning service shows highest profit margin at 67%</p>
-          <p>• Customer retention rate improved 12% after loyalty program launch</p>
-          <p>• Peak hours are 6-8 PM - optimize pickup/delivery scheduling</p>
-          <p>• Average order value increased 8% with AI pricing recommendations</p>
+          {busiestDay.orders > 0 && <p>• {busiestDay.day} is the busiest day with {busiestDay.orders.toLocaleString()} orders</p>}
+          {topService && (
+            <p>
+              • {topService.name} brings in the most revenue at {formatMoney(topService.revenue)}
+            </p>
+          )}
+          {busiestSlot && (
+            <p>
+              • The most booked pickup slot is {busiestSlot[0]} with {busiestSlot[1].toLocaleString()} pickups
+            </p>
+          )}
+          <p>
+            • {summary.items.toLocaleString()} items processed across {summary.orders.toLocaleString()} orders
+          </p>
         </div>
       </Card>
     </div>